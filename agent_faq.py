@@ -0,0 +1,95 @@
+import functools
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from rag_lexical import BM25Index, tokenize
+
+HEADING_RE = re.compile(r'^(#+)\s+(.*?)\s*#*\s*$')
+
+# Words that say nothing about which question is meant.
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does for from how i if in is it me my of on or our the to
+we what when where which who why will with you your
+""".split())
+
+
+class FaqSection(NamedTuple):
+    question: str
+    answer: str
+
+
+def parse_faq(markdown: str) -> List[FaqSection]:
+    """Split a markdown FAQ into (heading, body) sections; headings without a body are skipped."""
+    sections = []
+    question, body = None, []
+    for line in markdown.splitlines():
+        heading = HEADING_RE.match(line)
+        if heading:
+            if question and ''.join(body).strip():
+                sections.append(FaqSection(question, '\n'.join(body).strip()))
+            question, body = heading.group(2), []
+        elif question is not None:
+            body.append(line)
+    if question and ''.join(body).strip():
+        sections.append(FaqSection(question, '\n'.join(body).strip()))
+    return sections
+
+
+def _terms(text: str) -> set:
+    return {t for t in tokenize(text) if t not in STOPWORDS}
+
+
+class FaqIndex:
+    """BM25 over the question/answer sections of an FAQ, built once.
+
+    `search` returns the best sections for a question. `direct_answer` returns
+    a section when the question clearly asks it: the content words of the
+    query and of the section's question overlap by at least `min_overlap`
+    (Jaccard), every content word of the query appears somewhere in the
+    section, and its score beats the runner-up by `margin`.
+    """
+
+    def __init__(self, markdown: str, margin: float = 1.5, min_overlap: float = 0.8):
+        self.sections = parse_faq(markdown)
+        self.margin = margin
+        self.min_overlap = min_overlap
+        self._terms = [(_terms(s.question), _terms(f"{s.question} {s.answer}")) for s in self.sections]
+        # BM25Index.sync reads a store's `chunks`; the sections stand in for one.
+        self.chunks = [f"{s.question}\n{s.question}\n{s.answer}" for s in self.sections]
+        self.index = BM25Index()
+        self.index.sync(self)
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, FaqSection]]:
+        scores, ids = self.index.search(query, k)
+        return [(float(score), self.sections[i]) for score, i in zip(scores, ids)]
+
+    def direct_answer(self, query: str) -> Optional[FaqSection]:
+        scores, ids = self.index.search(query, 2)
+        if not len(ids):
+            return None
+        question_terms, section_terms = self._terms[ids[0]]
+        query_terms = _terms(query)
+        overlap = len(query_terms & question_terms)
+        if not question_terms or overlap < self.min_overlap * len(query_terms | question_terms):
+            return None
+        # Any word the section never mentions (say, "insurance") is a question it does not answer verbatim.
+        if not query_terms <= section_terms:
+            return None
+        if len(ids) > 1 and scores[0] < self.margin * scores[1]:
+            return None
+        return self.sections[ids[0]]
+
+
+def format_sections(sections: List[FaqSection]) -> str:
+    return '\n\n'.join(f"# {s.question}\n{s.answer}" for s in sections)
+
+
+@functools.lru_cache(maxsize=None)
+def load_faq(path: str) -> Tuple[str, FaqIndex]:
+    """The FAQ text and its index, read and built once per process."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    return text, FaqIndex(text)
@@ -0,0 +1,111 @@
+import json
+from typing import Callable, List, Optional
+
+STALE_TOOL_RESULT = "[older tool result removed to save space]"
+
+
+def estimate_tokens(value) -> int:
+    return len(json.dumps(value, default=str)) // 4
+
+
+def _plain(content):
+    # Store SDK content blocks as dicts so they can be measured, edited and resent.
+    if isinstance(content, list):
+        return [block.model_dump(exclude_none=True) if hasattr(block, 'model_dump') else block
+                for block in content]
+    return content
+
+
+def _is_tool_result(message: dict) -> bool:
+    content = message['content']
+    return isinstance(content, list) and any(block.get('type') == 'tool_result' for block in content)
+
+
+def _text_of(message: dict) -> str:
+    content = message['content']
+    if isinstance(content, str):
+        return content
+    return ' '.join(block['text'] for block in content if block.get('type') == 'text')
+
+
+def summarize_turns(messages: List[dict], max_chars: int = 300) -> str:
+    """One line per dropped message with text: what the user asked and what the assistant said."""
+    lines = []
+    for message in messages:
+        text = ' '.join(_text_of(message).split())
+        if text:
+            lines.append(f"{message['role']}: {text[:max_chars]}")
+    return '\n'.join(lines)
+
+
+class ConversationHistory:
+    """The messages sent to the model on every turn, kept under `max_tokens`.
+
+    A turn is a user message plus the assistant replies and tool round trips
+    that follow it, up to the next user message. When the history goes over
+    budget, tool results outside the last `keep_turns` turns are replaced by a
+    placeholder first. If that is not enough, the oldest turns are dropped
+    whole, so every tool_use keeps its tool_result. Dropped turns are
+    condensed by `summarize` into `summary`, which goes into the system prompt.
+    The latest turn is never touched.
+
+    `turn_tokens` holds the input tokens the API reported for each request.
+    """
+
+    def __init__(self, max_tokens: int = 8000, keep_turns: int = 4, max_summary_tokens: int = 500,
+                 summarize: Callable[[List[dict]], str] = summarize_turns,
+                 count_tokens: Callable[[object], int] = estimate_tokens):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.max_summary_tokens = max_summary_tokens
+        self.summarize = summarize
+        self.count_tokens = count_tokens
+        self.messages: List[dict] = []
+        self.summary = ""
+        self.turn_tokens: List[int] = []
+        self.compactions = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, role: str, content) -> None:
+        self.messages.append({"role": role, "content": _plain(content)})
+
+    def record(self, usage) -> None:
+        """Note the input tokens of a request, from `response.usage`."""
+        self.turn_tokens.append(usage.input_tokens + (getattr(usage, 'cache_creation_input_tokens', None) or 0)
+                                + (getattr(usage, 'cache_read_input_tokens', None) or 0))
+
+    def tokens(self) -> int:
+        return self.count_tokens(self.messages) + self.count_tokens(self.summary)
+
+    def system(self) -> Optional[str]:
+        if not self.summary:
+            return None
+        return f"Summary of the earlier part of this conversation:\n{self.summary}"
+
+    def _turn_starts(self) -> List[int]:
+        return [i for i, m in enumerate(self.messages) if m['role'] == 'user' and not _is_tool_result(m)]
+
+    def compact(self) -> bool:
+        """Shrink the history if it is over budget; returns whether anything changed."""
+        if self.tokens() <= self.max_tokens:
+            return False
+        starts = self._turn_starts()
+        recent = starts[-self.keep_turns] if len(starts) >= self.keep_turns else 0
+        for message in self.messages[:recent]:
+            if _is_tool_result(message):
+                message['content'] = [dict(block, content=STALE_TOOL_RESULT) if block.get('type') == 'tool_result'
+                                      else block for block in message['content']]
+
+        while self.tokens() > self.max_tokens and len(starts) > 1:
+            dropped, self.messages = self.messages[:starts[1]], self.messages[starts[1]:]
+            self.summary = '\n'.join(filter(None, [self.summary, self.summarize(dropped)]))
+            starts = self._turn_starts()
+        # Oldest summary lines go first once the summary itself outgrows its share.
+        lines = self.summary.split('\n')
+        while len(lines) > 1 and self.count_tokens('\n'.join(lines)) > self.max_summary_tokens:
+            lines.pop(0)
+        self.summary = '\n'.join(lines)
+        self.compactions += 1
+        return True
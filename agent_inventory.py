@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cars (
+    id TEXT PRIMARY KEY,
+    location TEXT NOT NULL,
+    model TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cars_location ON cars (location);
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    car_id TEXT NOT NULL REFERENCES cars (id),
+    start_at TEXT NOT NULL,
+    end_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    created TEXT NOT NULL
+);
+-- Availability checks only ever look at active bookings of one car around a time.
+CREATE INDEX IF NOT EXISTS bookings_active ON bookings (car_id, start_at, end_at) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS bookings_status ON bookings (status, car_id);
+"""
+
+# Times are stored as naive ISO 8601 strings, which sort chronologically.
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def parse_time(value: Optional[str], default: Optional[datetime] = None) -> datetime:
+    """An ISO 8601 date or datetime; `default` (else now) when empty. Raises ValueError otherwise."""
+    if not value:
+        return default or datetime.now().replace(microsecond=0)
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    return parsed.replace(tzinfo=None, microsecond=0)
+
+
+def _fmt(moment: datetime) -> str:
+    return moment.strftime(TIME_FORMAT)
+
+
+class InventoryStore:
+    """Cars and bookings in SQLite (WAL mode), safe to share between threads and sessions.
+
+    Every thread gets its own connection. Bookings, cancellations and changes
+    run in `BEGIN IMMEDIATE` transactions, so two sessions can never book
+    overlapping windows on the same car. `writes` counts the transactions
+    committed through this store, so callers caching reads can tell when
+    another session has changed something.
+    """
+
+    def __init__(self, path: str = '.travel_db/inventory.sqlite', busy_timeout: float = 30.0):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self.writes = 0
+        self._writes_lock = threading.Lock()
+        db = self._db()
+        db.executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA foreign_keys=ON")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _write(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        with self._writes_lock:
+            self.writes += 1
+
+    def add_cars(self, cars: Iterable[Tuple[str, str, str]]) -> None:
+        """Insert (id, location, model) rows; existing ids are left alone."""
+        with self._write() as db:
+            db.executemany("INSERT OR IGNORE INTO cars (id, location, model) VALUES (?, lower(?), ?)", cars)
+
+    def count_cars(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM cars").fetchone()[0]
+
+    def available(self, location: str, start: datetime, end: datetime, limit: int = 20) -> List[dict]:
+        """Cars at `location` with no active booking overlapping [start, end)."""
+        rows = self._db().execute("""
+            SELECT c.id, c.model FROM cars c
+            WHERE c.location = lower(?) AND NOT EXISTS (
+                SELECT 1 FROM bookings b
+                WHERE b.car_id = c.id AND b.status = 'active' AND b.start_at < ? AND b.end_at > ?
+            )
+            LIMIT ?
+        """, (location, _fmt(end), _fmt(start), limit))
+        return [dict(row) for row in rows]
+
+    def has_location(self, location: str) -> bool:
+        row = self._db().execute("SELECT 1 FROM cars WHERE location = lower(?) LIMIT 1", (location,)).fetchone()
+        return row is not None
+
+    def bookings(self, car_id: str, status: Optional[str] = 'active') -> List[dict]:
+        if status is None:
+            rows = self._db().execute("SELECT * FROM bookings WHERE car_id = ? ORDER BY start_at", (car_id,))
+        else:
+            rows = self._db().execute("SELECT * FROM bookings WHERE car_id = ? AND status = ? ORDER BY start_at",
+                                      (car_id, status))
+        return [dict(row) for row in rows]
+
+    def book(self, car_id: str, start: datetime, end: datetime) -> Optional[int]:
+        """Book `car_id` for [start, end); the booking id, or None if the car is taken then."""
+        with self._write() as db:
+            if db.execute("SELECT 1 FROM cars WHERE id = ?", (car_id,)).fetchone() is None:
+                raise KeyError(car_id)
+            if self._overlaps(db, car_id, start, end):
+                return None
+            cursor = db.execute("INSERT INTO bookings (car_id, start_at, end_at, created) VALUES (?, ?, ?, ?)",
+                                (car_id, _fmt(start), _fmt(end), _fmt(datetime.now())))
+            return cursor.lastrowid
+
+    def cancel(self, car_id: str) -> int:
+        """Cancel the active bookings of `car_id`; returns how many there were."""
+        with self._write() as db:
+            return db.execute("UPDATE bookings SET status = 'cancelled' WHERE car_id = ? AND status = 'active'",
+                              (car_id,)).rowcount
+
+    def change(self, car_id: str, new_car_id: str) -> int:
+        """Move the active bookings of `car_id` to `new_car_id`, all or nothing.
+
+        Returns how many moved; raises KeyError for an unknown car and
+        ValueError if `new_car_id` is taken during any of the windows.
+        """
+        if new_car_id == car_id:
+            return 0
+        with self._write() as db:
+            if db.execute("SELECT 1 FROM cars WHERE id = ?", (new_car_id,)).fetchone() is None:
+                raise KeyError(new_car_id)
+            rows = db.execute("SELECT id, start_at, end_at FROM bookings WHERE car_id = ? AND status = 'active'",
+                              (car_id,)).fetchall()
+            for row in rows:
+                if self._overlaps(db, new_car_id, parse_time(row['start_at']), parse_time(row['end_at'])):
+                    raise ValueError(f"{new_car_id} is already booked between {row['start_at']} and {row['end_at']}")
+            db.execute("UPDATE bookings SET car_id = ? WHERE car_id = ? AND status = 'active'", (new_car_id, car_id))
+            return len(rows)
+
+    @staticmethod
+    def _overlaps(db, car_id: str, start: datetime, end: datetime) -> bool:
+        return db.execute(
+            "SELECT 1 FROM bookings WHERE car_id = ? AND status = 'active' AND start_at < ? AND end_at > ?",
+            (car_id, _fmt(end), _fmt(start)),
+        ).fetchone() is not None
+
+    def close(self) -> None:
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+def default_window(start: Optional[str], end: Optional[str]) -> Tuple[datetime, datetime]:
+    """The booking window for tool input: from `start` (default now) to `end` (default a day later)."""
+    begin = parse_time(start)
+    finish = parse_time(end, begin + timedelta(days=1))
+    if finish <= begin:
+        raise ValueError(f"end {finish.isoformat()} is not after start {begin.isoformat()}")
+    return begin, finish
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Awaitable, Callable, List, Optional
+
+from agent_inventory import InventoryStore
+from llm_client import shared_client
+from llm_usage import percentile
+from simple_agent_soln import SomeCarRentalAi
+from utils import ANTHROPIC_API_KEY
+
+Confirm = Callable[[str, str], Awaitable[bool]]
+
+
+def process_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class Session:
+    """One conversation: its agent, a lock so its turns run one at a time, and when it was last used."""
+
+    def __init__(self, session_id: str, agent: SomeCarRentalAi):
+        self.id = session_id
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.created = self.last_used = time.monotonic()
+        self.turns = 0
+        # History size after the last turn; counting it on every sweep would walk every message.
+        self.tokens = 0
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+
+class SessionManager:
+    """Many concurrent agent conversations over one client and one inventory store.
+
+    Every session is a `SomeCarRentalAi` sharing the manager's client (so one
+    connection pool and one set of rate limits) and `InventoryStore`. Turns
+    run on a bounded thread pool, one at a time per session. Side-effect
+    tools are confirmed by awaiting `confirm(session_id, question)`; without
+    it, or if it does not answer within `confirm_timeout`, they are declined.
+
+    `evict()` drops sessions idle for longer than `idle_timeout`, then the
+    least recently used idle sessions while the sessions' histories together
+    are over `max_history_tokens`. RSS does not shrink as soon as a session
+    is dropped, so while the process is over `max_rss_bytes` each sweep
+    evicts at most `rss_evict_fraction` of the sessions and leaves the rest
+    to later sweeps. `run()` calls it every `sweep_interval`. Opening a
+    session past `max_sessions` evicts the least recently used idle one.
+    Busy sessions are never evicted.
+    """
+
+    def __init__(self, client=None, store: Optional[InventoryStore] = None, confirm: Optional[Confirm] = None,
+                 idle_timeout: float = 900.0, max_sessions: int = 1000, max_history_tokens: int = 2_000_000,
+                 max_rss_bytes: Optional[int] = None, workers: int = 64, confirm_timeout: float = 300.0,
+                 sweep_interval: float = 30.0, rss_evict_fraction: float = 0.1, **agent_options):
+        self.client = client or shared_client(ANTHROPIC_API_KEY)
+        self.store = store or InventoryStore()
+        self.confirm = confirm
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_history_tokens = max_history_tokens
+        self.max_rss_bytes = max_rss_bytes
+        self.rss_evict_fraction = rss_evict_fraction
+        self.confirm_timeout = confirm_timeout
+        self.sweep_interval = sweep_interval
+        self.agent_options = {'verbose': False, **agent_options}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='session')
+        # Least recently used first.
+        self.sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        self.turn_latency: List[float] = []
+        self.evicted = {'idle': 0, 'memory': 0, 'capacity': 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def session(self, session_id: str) -> Session:
+        """The session for `session_id`, opened on first use."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+        if len(self.sessions) >= self.max_sessions:
+            self._evict_lru('capacity', lambda: len(self.sessions) >= self.max_sessions)
+        agent = SomeCarRentalAi(client=self.client, store=self.store,
+                                confirm=lambda question: self._confirm(session_id, question), **self.agent_options)
+        session = self.sessions[session_id] = Session(session_id, agent)
+        return session
+
+    def _confirm(self, session_id: str, question: str) -> bool:
+        # Runs on a worker thread, in the middle of a turn: hand the question to the event loop and wait.
+        if self.confirm is None:
+            return False
+        future = asyncio.run_coroutine_threadsafe(self.confirm(session_id, question), self._loop)
+        try:
+            return bool(future.result(timeout=self.confirm_timeout))
+        except FutureTimeout:
+            future.cancel()
+            return False
+
+    def _turn(self, session: Session, text: str) -> Optional[str]:
+        try:
+            return session.agent.query(text)
+        finally:
+            session.tokens = session.agent.history.tokens()
+
+    async def turn(self, session_id: str, text: str) -> Optional[str]:
+        """Answer `text` in the conversation `session_id`; the agent's final reply."""
+        self._loop = asyncio.get_running_loop()
+        session = self.session(session_id)
+        async with session.lock:
+            started = time.perf_counter()
+            try:
+                return await self._loop.run_in_executor(self.pool, self._turn, session, text)
+            finally:
+                self.turn_latency.append(time.perf_counter() - started)
+                session.turns += 1
+                session.last_used = time.monotonic()
+
+    def end(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+    def history_tokens(self) -> int:
+        return sum(session.tokens for session in self.sessions.values())
+
+    def over_rss(self) -> bool:
+        if self.max_rss_bytes is None:
+            return False
+        rss = process_rss()
+        return rss is not None and rss > self.max_rss_bytes
+
+    def _evict_lru(self, reason: str, while_: Callable[[], bool], limit: Optional[int] = None) -> List[str]:
+        evicted = []
+        for session_id, session in list(self.sessions.items()):
+            if not while_() or (limit is not None and len(evicted) >= limit):
+                break
+            if session.busy:
+                continue
+            del self.sessions[session_id]
+            self.evicted[reason] += 1
+            evicted.append(session_id)
+        return evicted
+
+    def evict(self, now: Optional[float] = None) -> List[str]:
+        """Drop idle sessions, then least recently used ones under memory pressure; the ids dropped."""
+        now = time.monotonic() if now is None else now
+        evicted = []
+        for session_id, session in list(self.sessions.items()):
+            if not session.busy and now - session.last_used > self.idle_timeout:
+                del self.sessions[session_id]
+                self.evicted['idle'] += 1
+                evicted.append(session_id)
+        evicted += self._evict_lru('memory', lambda: self.history_tokens() > self.max_history_tokens)
+        if self.over_rss():
+            # Checked once per sweep: the next sweep sees what this one freed.
+            limit = max(1, int(len(self.sessions) * self.rss_evict_fraction))
+            evicted += self._evict_lru('memory', lambda: True, limit)
+        return evicted
+
+    async def run(self) -> None:
+        """Sweep for sessions to evict every `sweep_interval`, until cancelled."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict()
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        self.sessions.clear()
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self.sessions),
+            'busy': sum(session.busy for session in self.sessions.values()),
+            'turns': len(self.turn_latency),
+            'turn_p50': percentile(self.turn_latency, 50),
+            'turn_p99': percentile(self.turn_latency, 99),
+            'history_tokens': self.history_tokens(),
+            'evicted': dict(self.evicted),
+        }
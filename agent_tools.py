@@ -0,0 +1,114 @@
+import json
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class ToolRegistry:
+    """Tool schemas, built once, and the methods that implement them.
+
+    Decorate methods with `@registry.tool(...)`; the method name is the tool
+    name. `schemas` is the list to pass as `tools=` and never changes after
+    import, and `bind(obj)` gives the name -> bound method dispatch table.
+    """
+
+    def __init__(self):
+        self.schemas: List[dict] = []
+        self.side_effects = set()
+        self._methods: Dict[str, Callable] = {}
+
+    def declare(self, name: str, description: str, properties: dict, required=(), side_effect: bool = False) -> None:
+        """Add a tool schema, for tools handled outside the decorated class."""
+        self.schemas.append({
+            "name": name,
+            "description": description,
+            "input_schema": {"type": "object", "properties": properties, "required": list(required)},
+        })
+        if side_effect:
+            self.side_effects.add(name)
+
+    def tool(self, description: str, properties: dict, required=(), side_effect: bool = False):
+        def register(method):
+            self.declare(method.__name__, description, properties, required, side_effect)
+            self._methods[method.__name__] = method
+            return method
+        return register
+
+    def bind(self, obj) -> Dict[str, Callable]:
+        return {name: method.__get__(obj) for name, method in self._methods.items()}
+
+
+class MemoizedTools:
+    """Per-session memo of read-only tool results.
+
+    `call(name, tool_input)` runs `call_tool` for side-effect tools (per
+    `has_side_effect`) and drops every memoized result once it has run, since
+    a booking or cancellation can change what the read-only tools return.
+    Other tools are answered from the memo when called again with the same input;
+    a result is only kept if no side-effect tool ran while it was being computed.
+
+    `version()`, if given, is a counter of writes made elsewhere (say, other
+    sessions sharing the inventory); the memo is dropped whenever it moves.
+    Calls for which `memoizable(name, tool_input)` is false always run.
+    """
+
+    def __init__(self, call_tool: Callable[[str, dict], object], has_side_effect: Callable[[str], bool],
+                 version: Optional[Callable[[], int]] = None,
+                 memoizable: Optional[Callable[[str, dict], bool]] = None):
+        self.call_tool = call_tool
+        self.has_side_effect = has_side_effect
+        self.version = version
+        self.memoizable = memoizable
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._generation = 0
+        self._version = version() if version else None
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def _invalidate(self) -> None:
+        self._results.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def _check_version(self) -> None:
+        # Called with the lock held.
+        if self.version is not None:
+            current = self.version()
+            if current != self._version:
+                self._version = current
+                self._invalidate()
+
+    def call(self, name: str, tool_input: dict):
+        if self.has_side_effect(name):
+            try:
+                return self.call_tool(name, tool_input)
+            finally:
+                with self._lock:
+                    self._invalidate()
+        if self.memoizable is not None and not self.memoizable(name, tool_input):
+            return self.call_tool(name, tool_input)
+
+        key = (name, json.dumps(tool_input, sort_keys=True, default=str))
+        with self._lock:
+            self._check_version()
+            if key in self._results:
+                self.hits += 1
+                return self._results[key]
+            self.misses += 1
+            generation = self._generation
+        result = self.call_tool(name, tool_input)
+        with self._lock:
+            self._check_version()
+            if generation == self._generation:
+                self._results[key] = result
+        return result
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,79 @@
+"""Query-embedding latency and batch throughput of the encoder modes against fp32.
+
+    python -m benchmarks.encoder --modes fp32 int8 onnx
+
+Agreement is the mean cosine similarity between a mode's embeddings and the
+fp32 ones for the same sentences; near 1.0 means retrieval barely changes.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from rag_encoder import get_encoder
+
+SENTENCES = [
+    "Who directed movie Mickey 17, and what is it about?",
+    "How many businesses reported a decline in earnings?",
+    "What do you need to rent a car in Canada?",
+    "Is minor damage like scratches covered by the damage waiver?",
+    "Which semiconductor companies are exploring alternative paths to innovation?",
+    "The jury found Greenpeace must pay over $660 million in the pipeline case.",
+    "New measles cases were confirmed in residents who travelled internationally.",
+    "The alliance of Sahel states forges ahead with a common currency plan.",
+]
+
+
+def percentile(values, q):
+    return float(np.percentile(np.asarray(values) * 1000, q))
+
+
+def bench(model_name: str, mode: str, queries: int, batch_size: int, batches: int):
+    start = time.perf_counter()
+    encoder = get_encoder(model_name, mode)
+    encoder.encode(SENTENCES[:1])  # warm up
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(queries):
+        t = time.perf_counter()
+        encoder.encode([SENTENCES[i % len(SENTENCES)]])
+        latencies.append(time.perf_counter() - t)
+
+    batch = [SENTENCES[i % len(SENTENCES)] + f" ({i})" for i in range(batch_size)]
+    t = time.perf_counter()
+    for _ in range(batches):
+        encoder.encode(batch, batch_size=batch_size)
+    throughput = batch_size * batches / (time.perf_counter() - t)
+
+    return load_s, latencies, throughput, np.asarray(encoder.encode(SENTENCES), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--modes', nargs='+', default=['fp32', 'int8'])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batches', type=int, default=10)
+    args = parser.parse_args()
+
+    modes = ['fp32'] + [m for m in args.modes if m != 'fp32']
+    baseline = None
+    print(f"{'mode':>10} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'sent/s':>9} {'speedup':>8} {'agreement':>10}")
+    for mode in modes:
+        try:
+            load_s, latencies, throughput, vectors = bench(args.model, mode, args.queries, args.batch_size, args.batches)
+        except ImportError as e:
+            print(f"{mode:>10} skipped: {e}")
+            continue
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        if baseline is None:
+            baseline = (np.median(latencies), vectors)
+        agreement = float(np.mean(np.sum(vectors * baseline[1], axis=1)))
+        print(f"{mode:>10} {load_s:8.2f} {percentile(latencies, 50):8.2f} {percentile(latencies, 95):8.2f} "
+              f"{throughput:9.0f} {baseline[0] / np.median(latencies):7.2f}x {agreement:10.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""CPU time per page and prompt tokens per article: extract_main_text vs BeautifulSoup get_text.
+
+    python -m benchmarks.extract --pages 200
+    python -m benchmarks.extract saved/*.html
+
+Without files it uses synthetic news pages with a navigation bar, inline
+scripts, a sidebar and a footer around the article. Tokens are estimated as
+4 characters each, the same as the default extraction budget.
+"""
+import argparse
+import glob
+import random
+import time
+
+from bs4 import BeautifulSoup
+
+from feed_extract import estimate_tokens, extract_main_text
+
+WORDS = ("market shares rate bank inflation policy central growth quarter earnings chip supply demand "
+         "investors analysts said week report energy prices court ruling scientists study data").split()
+
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 24))
+    return ' '.join(words).capitalize() + '.'
+
+
+def synthetic_page(rng: random.Random) -> str:
+    nav = ''.join(f'<li><a href="/s{i}">Section {i}</a></li>' for i in range(40))
+    script = '<script>window.__STATE__ = ' + '{"k": "' + 'x' * 20000 + '"}</script>'
+    paragraphs = ''.join(f'<p>{" ".join(sentence(rng) for _ in range(rng.randint(2, 6)))}</p>'
+                         for _ in range(rng.randint(10, 40)))
+    related = ''.join(f'<li><a href="/r{i}">{sentence(rng)}</a></li>' for i in range(15))
+    footer = '<footer>' + ''.join(f'<a href="/f{i}">Footer link {i}</a>' for i in range(60)) + '</footer>'
+    return (f'<html><head><style>body {{ color: red; }}</style>{script}</head><body>'
+            f'<header><nav><ul>{nav}</ul></nav></header>'
+            f'<article><h1>{sentence(rng)}</h1>{paragraphs}</article>'
+            f'<aside><ul>{related}</ul></aside>{footer}</body></html>')
+
+
+def bench(pages, extract):
+    tokens = 0
+    start = time.process_time()
+    for page in pages:
+        tokens += estimate_tokens(extract(page))
+    return (time.process_time() - start) / len(pages), tokens / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help="saved HTML pages (default: synthetic pages)")
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--max-tokens', type=int, default=3000)
+    args = parser.parse_args()
+
+    if args.files:
+        pages = []
+        for pattern in args.files:
+            for path in glob.glob(pattern):
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    pages.append(f.read())
+    else:
+        rng = random.Random(0)
+        pages = [synthetic_page(rng) for _ in range(args.pages)]
+
+    methods = {
+        'bs4 get_text': lambda page: BeautifulSoup(page, 'html.parser').get_text(),
+        'extract_main_text': lambda page: extract_main_text(page, max_tokens=args.max_tokens),
+    }
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KiB each")
+    results = {name: bench(pages, extract) for name, extract in methods.items()}
+    base_cpu, base_tokens = results['bs4 get_text']
+    for name, (cpu, tokens) in results.items():
+        print(f"{name:>18}: {cpu * 1000:7.2f} ms CPU/page, {tokens:8.0f} tokens/article "
+              f"({base_cpu / cpu:.1f}x faster, {base_tokens - tokens:.0f} tokens saved)")
+
+
+if __name__ == '__main__':
+    main()
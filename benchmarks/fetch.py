@@ -0,0 +1,88 @@
+"""Article fetch throughput against a local HTTP server with slow and oversized pages.
+
+    python -m benchmarks.fetch --pages 300 --slow 10 --delay 2
+
+A few pages answer only after `--delay` seconds and one streams forever;
+with per-request timeouts and a body cap neither should hold up the rest.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from feed_fetch import Fetcher
+
+PAGE = ("<html><body><article><h1>Title</h1>" + "<p>Some article text.</p>" * 200 + "</article></body></html>").encode()
+
+
+def serve(delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path.startswith('/endless'):
+                self.send_response(200)
+                self.send_header('content-type', 'text/html')
+                self.end_headers()
+                try:
+                    while True:
+                        self.wfile.write(b"<p>" + b"x" * 65536 + b"</p>")
+                except OSError:
+                    return
+            if self.path.startswith('/slow'):
+                time.sleep(delay)
+            self.send_response(200)
+            self.send_header('content-type', 'text/html; charset=utf-8')
+            self.send_header('content-length', str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 256
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(base: str, urls, per_host: int, timeout: float):
+    done = errors = nbytes = 0
+    first = None
+    start = time.perf_counter()
+    async with Fetcher(per_host=per_host, read_timeout=timeout, total_timeout=timeout,
+                       max_bytes=2 * 2**20) as fetcher:
+        async for url, result in fetcher.fetch_many(urls):
+            first = first or time.perf_counter() - start
+            done += 1
+            errors += not result.ok
+            nbytes += len(result.content)
+    return time.perf_counter() - start, first, done, errors, nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--slow', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=2.0)
+    parser.add_argument('--per-host', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = serve(args.delay)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/slow/{i}" for i in range(args.slow)] + [f"{base}/endless"]
+    urls += [f"{base}/page/{i}" for i in range(args.pages - len(urls))]
+
+    elapsed, first, done, errors, nbytes = asyncio.run(run(base, urls, args.per_host, args.timeout))
+    print(f"{done} pages in {elapsed:.2f}s ({done / elapsed:.0f} pages/s), first after {first * 1000:.0f} ms, "
+          f"{errors} errors, {nbytes / 2**20:.1f} MiB")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
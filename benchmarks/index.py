@@ -0,0 +1,82 @@
+"""Latency, recall@k and memory of the SimpleRag index backends on synthetic embeddings.
+
+    python -m benchmarks.index --n 1000000 --queries 200
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from rag_index import make_index
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    # Sentence embeddings are far from uniform; a gaussian mixture is a closer stand-in.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 100000):
+        m = min(100000, n - i)
+        out[i:i + m] = centers[rng.integers(clusters, size=m)] + 0.6 * rng.standard_normal((m, dim), dtype=np.float32)
+    return out
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    ids = []
+    start = time.perf_counter()
+    for q in queries:
+        ids.append(index.search(q[None, :], k)[1][0])
+    elapsed = time.perf_counter() - start
+    return np.array(ids), elapsed / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--rescore', type=int, nargs='+', default=[4, 10, 100])
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.n, args.dim, clusters=max(16, args.n // 2000))
+    store = SimpleNamespace(embeddings=data)
+    rng = np.random.default_rng(1)
+    queries = data[rng.choice(args.n, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    exact = make_index('exact')
+    exact.sync(store)
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    print(f"n={args.n} dim={args.dim} k={args.k}")
+    print(f"{'exact':>12}  {exact_ms:8.2f} ms/query  recall@{args.k}=1.000  {data.nbytes / 2**20:8.1f} MiB")
+
+    ivf = make_index('ivf')
+    start = time.perf_counter()
+    ivf.sync(store)
+    print(f"{'ivf build':>12}  {time.perf_counter() - start:8.2f} s  ({len(ivf.centroids)} lists)")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, ms = timed_search(ivf, queries, args.k)
+        print(f"{f'ivf/{nprobe}':>12}  {ms:8.2f} ms/query  recall@{args.k}={recall_at_k(truth, found):.3f}")
+
+    # Compressed codes stay in memory; the float32 matrix is only read for rescoring.
+    for kind in ('int8', 'binary'):
+        index = make_index(kind)
+        index.sync(store)
+        for rescore in args.rescore:
+            index.rescore = rescore
+            found, ms = timed_search(index, queries, args.k)
+            print(f"{f'{kind}/{rescore}x':>12}  {ms:8.2f} ms/query  recall@{args.k}={recall_at_k(truth, found):.3f}  "
+                  f"{index.nbytes / 2**20:8.1f} MiB ({data.nbytes / index.nbytes:.0f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Availability queries and bookings against a large fleet in the SQLite inventory store.
+
+    python -m benchmarks.inventory --cars 1000000 --locations 2000 --queries 5000 --threads 32
+
+Builds a fleet of `--cars` spread over `--locations`, books a share of them
+for random windows, then runs `--queries` availability lookups from
+`--threads` threads and has every thread race to book the same car. Exactly
+one of those bookings may succeed.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from agent_inventory import InventoryStore
+
+MODELS = ["honda civic 2022", "toyota corolla 2023", "ford escape 2021", "tesla model 3 2024"]
+EPOCH = datetime(2025, 3, 1)
+
+
+def build(store: InventoryStore, cars: int, locations: int, booked: float, rng: random.Random):
+    batch = 100_000
+    for first in range(0, cars, batch):
+        store.add_cars((f"c{i}", f"city{i % locations}", MODELS[i % len(MODELS)])
+                       for i in range(first, min(cars, first + batch)))
+    db = store._db()
+    db.execute("BEGIN")
+    rows = []
+    for i in rng.sample(range(cars), int(cars * booked)):
+        start = EPOCH + timedelta(hours=rng.randrange(0, 60 * 24))
+        rows.append((f"c{i}", start.isoformat(), (start + timedelta(days=rng.randint(1, 7))).isoformat(),
+                     EPOCH.isoformat()))
+    db.executemany("INSERT INTO bookings (car_id, start_at, end_at, created) VALUES (?, ?, ?, ?)", rows)
+    db.execute("COMMIT")
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cars', type=int, default=1_000_000)
+    parser.add_argument('--locations', type=int, default=2000)
+    parser.add_argument('--booked', type=float, default=0.3, help="share of cars with a booking")
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = InventoryStore(os.path.join(tempfile.mkdtemp(), 'inventory.sqlite'))
+    start = time.perf_counter()
+    bookings = build(store, args.cars, args.locations, args.booked, rng)
+    print(f"built {args.cars} cars, {bookings} bookings in {time.perf_counter() - start:.1f}s")
+
+    def query(i):
+        local = random.Random(i)
+        at = EPOCH + timedelta(hours=local.randrange(0, 60 * 24))
+        t = time.perf_counter()
+        store.available(f"city{local.randrange(args.locations)}", at, at + timedelta(days=1))
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        latencies = np.array(list(pool.map(query, range(args.queries)))) * 1000
+    wall = time.perf_counter() - start
+    print(f"{args.queries} availability queries on {args.threads} threads: {args.queries / wall:.0f}/s, "
+          f"p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms")
+
+    window = (EPOCH + timedelta(days=90), EPOCH + timedelta(days=91))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(lambda _: store.book("c0", *window), range(args.threads)))
+    won = sum(r is not None for r in results)
+    print(f"{args.threads} concurrent bookings of one car: {won} succeeded in {time.perf_counter() - start:.2f}s")
+    assert won == 1, won
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Check prompt caching against the local stub, which enforces each model's minimum cacheable length.
+
+    python -m benchmarks.prompt_cache
+
+Runs two newsletter renders and prints the cache write/read token counts
+recorded from `response.usage`. The newsletter's system prompt is shorter
+than Haiku's minimum cacheable prefix, so it is not marked and no cache
+tokens should be recorded; marking it anyway is shown to cache nothing.
+A system prompt past the minimum is then checked to write the cache on the
+first call and read it on the second. (FAQ questions send a few retrieved
+sections, not the whole FAQ, see `agent_faq.py`.)
+"""
+import os
+import tempfile
+
+import anthropic
+
+from benchmarks.stub_anthropic import StubAnthropic, estimate_tokens, min_cacheable_tokens
+from llm_usage import UsageStats
+
+
+def cached_twice(client, params) -> UsageStats:
+    stats = UsageStats()
+    for _ in range(2):
+        stats.record(client.messages.create(**params))
+    return stats
+
+
+def main():
+    # Keep the local response cache out of the way: every call must reach the stub.
+    os.environ['LLM_CACHE_DIR'] = tempfile.mkdtemp()
+
+    import workflow_irl_soln
+
+    with StubAnthropic() as stub:
+        client = anthropic.Anthropic(api_key="stub", base_url=stub.base_url, max_retries=0)
+
+        workflow_irl_soln.client = client
+        item = workflow_irl_soln.RssItemDetailed("t", "Some description", "https://example.com/a", "", "")
+        for _ in range(2):
+            item.description += " (updated)"
+            workflow_irl_soln.present_content([item])
+        print("newsletter", workflow_irl_soln.usage.summary())
+        assert workflow_irl_soln.usage.totals['cache_creation_input_tokens'] == 0
+
+        system_prompt = stub.requests[-1]['system']
+        params = workflow_irl_soln.request_params("hello", system_prompt, cache_system=True)
+        minimum = min_cacheable_tokens(params['model'])
+        marked = cached_twice(client, params)
+        print(f"newsletter system prompt marked anyway: ~{estimate_tokens(system_prompt)} tokens, "
+              f"{params['model']} caches from {minimum}:", marked.summary())
+        assert marked.totals['cache_read_input_tokens'] == 0
+
+        long_prompt = system_prompt * (minimum // estimate_tokens(system_prompt) + 1)
+        params = workflow_irl_soln.request_params("hello", long_prompt, cache_system=True)
+        qualifying = cached_twice(client, params)
+        print(f"system prompt of ~{estimate_tokens(long_prompt)} tokens:", qualifying.summary())
+        assert qualifying.totals['cache_read_input_tokens'] > 0
+
+
+if __name__ == '__main__':
+    main()
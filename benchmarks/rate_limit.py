@@ -0,0 +1,57 @@
+"""Many threads calling the API at once, against a stub that throttles: plain SDK client vs RateLimitedClient.
+
+    python -m benchmarks.rate_limit --calls 300 --threads 32 --rps 20 --overload 0.05
+
+The stub answers 429 past `--rps` requests per second and a random share of
+calls with 529. The plain client gives up after the SDK's default two
+retries; the rate-limited one should finish every call with far fewer
+rejections.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+
+from benchmarks.stub_anthropic import StubAnthropic
+from llm_client import RateLimitedClient
+
+PARAMS = dict(model="claude-3-5-haiku-latest", max_tokens=64, messages=[{"role": "user", "content": "hi"}])
+
+
+def run(client, calls: int, threads: int):
+    def one(_):
+        try:
+            client.messages.create(**PARAMS)
+            return True
+        except anthropic.APIError:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        ok = sum(pool.map(one, range(calls)))
+    return ok, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rps', type=int, default=20)
+    parser.add_argument('--overload', type=float, default=0.05)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    for name in ('sdk', 'rate-limited'):
+        with StubAnthropic(latency=args.latency, requests_per_second=args.rps, overload_rate=args.overload) as stub:
+            client = anthropic.Anthropic(api_key="stub", base_url=stub.base_url)
+            if name == 'rate-limited':
+                # Configured well above the stub's limit: the headers and 429s have to rein it in.
+                client = RateLimitedClient(client, requests_per_minute=args.rps * 120, max_concurrency=args.threads)
+            ok, wall = run(client, args.calls, args.threads)
+            extra = f", client {client.stats()}" if isinstance(client, RateLimitedClient) else ""
+            print(f"{name:>12}: {ok}/{args.calls} ok in {wall:.1f}s, {stub.throttled} rejected by the server{extra}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Many concurrent conversations through one SessionManager, against a fake model in a separate process.
+
+    python -m benchmarks.sessions --sessions 50 200 500 --turns 4 --latency 0.2 --think 0.5
+
+Each simulated user opens a session and sends `--turns` messages, pausing
+`--think` seconds between them. The fake model answers every message with
+one tool call (a booking for messages that ask for one, confirmed through
+the async callback, else a listing) and then a text reply, after
+`--latency` seconds each. The model runs in its own process, so the CPU
+time measured is the manager's alone: sessions per core is the number of
+concurrent sessions served divided by the cores they kept busy.
+
+By default the client's rate limits are raised far above `RateLimitedClient`'s
+defaults, so the numbers are the manager's capacity, not an account's; the
+output says so. `--default-limits` keeps the defaults a plain
+`SessionManager()` gets from `shared_client` (50 requests per minute).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import anthropic
+
+from agent_inventory import InventoryStore
+from agent_sessions import SessionManager
+from benchmarks.stub_anthropic import StubAnthropic
+from llm_client import RateLimitedClient
+
+
+def respond(params):
+    last = params['messages'][-1]['content']
+    if not isinstance(last, str):
+        return {'content': [{'type': 'text', 'text': 'Done. Anything else I can help you with?'}],
+                'stop_reason': 'end_turn'}
+    if 'book' in last:
+        name, tool_input = 'book_car_rental', {'car_id': random.choice(['a1', 'a2', 'a3'])}
+    else:
+        name, tool_input = 'list_car_rental', {'location': 'toronto'}
+    return {'content': [{'type': 'tool_use', 'id': f"toolu_{uuid.uuid4().hex[:12]}", 'name': name,
+                         'input': tool_input}],
+            'stop_reason': 'tool_use'}
+
+
+def serve(latency, urls, stop):
+    with StubAnthropic(respond=respond, latency=latency) as stub:
+        urls.put(stub.base_url)
+        stop.wait()
+
+
+async def user(manager, session_id, turns, think):
+    for turn in range(turns):
+        text = "please book a car for tomorrow" if turn % 4 == 3 else "what cars do you have in Toronto?"
+        await manager.turn(session_id, text)
+        await asyncio.sleep(random.uniform(0, 2 * think))
+
+
+async def load(manager, sessions, turns, think):
+    evictor = asyncio.create_task(manager.run())
+    cpu, wall = time.process_time(), time.perf_counter()
+    try:
+        await asyncio.gather(*(user(manager, f"s{i}", turns, think) for i in range(sessions)))
+    finally:
+        evictor.cancel()
+    return time.process_time() - cpu, time.perf_counter() - wall
+
+
+async def approve(session_id, question):
+    # A user tapping "yes" a moment later.
+    await asyncio.sleep(0.05)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--turns', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.2, help="fake model latency per call, seconds")
+    parser.add_argument('--think', type=float, default=0.5, help="mean pause between a user's turns, seconds")
+    parser.add_argument('--workers', type=int, default=128)
+    parser.add_argument('--max-history-tokens', type=int, default=2_000_000)
+    parser.add_argument('--default-limits', action='store_true',
+                        help="keep RateLimitedClient's default rate limits instead of lifting them")
+    args = parser.parse_args()
+
+    urls, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.latency, urls, stop), daemon=True)
+    server.start()
+    try:
+        base_url = urls.get(timeout=10)
+        sdk = anthropic.Anthropic(api_key="stub", base_url=base_url)
+        if args.default_limits:
+            client = RateLimitedClient(sdk)
+            limits = "default client rate limits"
+        else:
+            # Limits high enough that only the model's latency and the manager itself set the pace.
+            client = RateLimitedClient(sdk, requests_per_minute=1e9, input_tokens_per_minute=1e12,
+                                       output_tokens_per_minute=1e12, max_concurrency=args.workers)
+            limits = "client rate limits lifted (not what a default SessionManager() gets)"
+        store = InventoryStore(os.path.join(tempfile.mkdtemp(), 'inventory.sqlite'))
+        print(f"{os.cpu_count()} cores, fake model latency {args.latency * 1000:.0f} ms, "
+              f"{args.turns} turns per session, {limits}")
+        for sessions in args.sessions:
+            manager = SessionManager(client=client, store=store, confirm=approve, workers=args.workers,
+                                     max_history_tokens=args.max_history_tokens, sweep_interval=1.0)
+            cpu, wall = asyncio.run(load(manager, sessions, args.turns, args.think))
+            stats = manager.stats()
+            manager.close()
+            cores = cpu / wall
+            print(f"{sessions:>5} sessions: {stats['turns'] / wall:6.1f} turns/s, "
+                  f"turn p50 {stats['turn_p50'] * 1000:5.0f} ms, p99 {stats['turn_p99'] * 1000:5.0f} ms, "
+                  f"{cores:.2f} cores busy, {sessions / max(cores, 1e-9):6.0f} sessions/core, "
+                  f"evicted {stats['evicted']}")
+    finally:
+        stop.set()
+        server.join(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
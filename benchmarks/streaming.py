@@ -0,0 +1,62 @@
+"""Time to first token and total latency of agent turns, blocking vs streaming, against the local stub.
+
+    python -m benchmarks.streaming --turns 5 --latency 0.3 --token-delay 0.02
+
+Each turn is a tool round trip (list cars, then a text answer). The stub
+waits `--latency` before the first event and `--token-delay` between words.
+"""
+import argparse
+import os
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+import anthropic
+
+from benchmarks.stub_anthropic import StubAnthropic
+
+ANSWER = ("We have three Honda Civic 2022 cars available in Toronto. Any of them can be booked for the "
+          "dates you asked about; pickup is at the downtown office and the car must be returned with a full tank. ")
+
+
+def respond(params):
+    # The tool takes ISO 8601 times, as the model is asked to send.
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    last = params['messages'][-1]['content']
+    if isinstance(last, str):
+        return {'content': [{'type': 'text', 'text': 'Let me check what we have. '},
+                            {'type': 'tool_use', 'id': f"toolu_{uuid.uuid4().hex[:12]}", 'name': 'list_car_rental',
+                             'input': {'location': 'toronto', 'time': tomorrow}}],
+                'stop_reason': 'tool_use'}
+    return {'content': [{'type': 'text', 'text': ANSWER * 3}], 'stop_reason': 'end_turn'}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    args = parser.parse_args()
+    os.environ['LLM_CACHE_DIR'] = tempfile.mkdtemp()
+
+    import simple_agent_soln
+
+    with StubAnthropic(respond=respond, latency=args.latency, token_delay=args.token_delay) as stub:
+        client = anthropic.Anthropic(api_key="stub", base_url=stub.base_url, max_retries=0)
+        for mode in ('blocking', 'streaming'):
+            agent = simple_agent_soln.SomeCarRentalAi(client=client)
+            for turn in range(args.turns):
+                question = f"What cars can I rent in Toronto tomorrow? ({turn})"
+                if mode == 'blocking':
+                    agent.query(question)
+                else:
+                    for _ in agent.stream_query(question):
+                        pass
+            stats = agent.latency.summary()
+            print(f"{mode:>9}: ttft p50 {stats['ttft_p50'] * 1000:6.0f} ms, p95 {stats['ttft_p95'] * 1000:6.0f} ms; "
+                  f"total p50 {stats['total_p50'] * 1000:6.0f} ms, p95 {stats['total_p95'] * 1000:6.0f} ms "
+                  f"over {stats['calls']} model calls")
+
+
+if __name__ == '__main__':
+    main()
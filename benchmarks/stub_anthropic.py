@@ -0,0 +1,324 @@
+"""A local stand-in for the Messages API, for exercising clients without the network.
+
+    with StubAnthropic() as stub:
+        client = anthropic.Anthropic(api_key="stub", base_url=stub.base_url)
+
+It answers POST /v1/messages with a canned reply (or whatever `respond`
+returns) and simulates prompt caching: the request prefix up to the last
+`cache_control` breakpoint is written to the cache on first sight and read
+from it afterwards, with matching `usage` token counts. As with the real
+API, a prefix shorter than the model's minimum cacheable length
+(`min_cacheable_tokens`) is silently not cached. Tokens are estimated as 4
+characters each.
+
+Message Batches are supported too: POST /v1/messages/batches answers its
+requests in the background, spread over `batch_delay` seconds, after which
+the batch and its JSONL results can be fetched. Canceling marks requests not
+yet answered as canceled, and `batch_outcome(custom_id)` may return
+'errored', 'canceled' or 'expired' to fail individual requests.
+
+Requests with `"stream": true` get the reply as server-sent events, one word
+(or JSON fragment) per delta, `token_delay` seconds apart. Non-streamed
+replies wait out the same generation time before answering.
+
+`requests_per_second` and `overload_rate` inject throttling: 429s with
+`retry-after` and `anthropic-ratelimit-requests-*` headers past the rate,
+and random 529 "overloaded" errors.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+# Shortest prefix each model will cache, by model name prefix; other models take DEFAULT_MIN_CACHEABLE_TOKENS.
+MIN_CACHEABLE_TOKENS = {
+    'claude-3-haiku': 2048,
+    'claude-3-5-haiku': 2048,
+    'claude-haiku-4-5': 4096,
+    'claude-opus-4-5': 4096,
+}
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+
+
+def estimate_tokens(value) -> int:
+    return max(1, len(json.dumps(value, ensure_ascii=False)) // 4)
+
+
+def min_cacheable_tokens(model: Optional[str]) -> int:
+    for name, tokens in MIN_CACHEABLE_TOKENS.items():
+        if (model or '').startswith(name):
+            return tokens
+    return DEFAULT_MIN_CACHEABLE_TOKENS
+
+
+def _segments(params: dict) -> list:
+    # Cache prefixes run tools -> system -> messages, in that order.
+    segments = list(params.get('tools') or [])
+    system = params.get('system')
+    if isinstance(system, str) and system:
+        segments.append({'type': 'text', 'text': system})
+    elif isinstance(system, list):
+        segments.extend(system)
+    for message in params.get('messages', []):
+        content = message['content']
+        if isinstance(content, str):
+            segments.append({'type': 'text', 'text': content})
+        else:
+            segments.extend(content)
+    return segments
+
+
+def _deltas(block: dict) -> list:
+    if block['type'] == 'tool_use':
+        data = json.dumps(block['input'])
+        return [{'type': 'input_json_delta', 'partial_json': data[i:i + 8]} for i in range(0, len(data), 8)]
+    return [{'type': 'text_delta', 'text': word} for word in re.findall(r'\S+\s*|\s+', block['text'])]
+
+
+def text_reply(params: dict) -> dict:
+    return {'content': [{'type': 'text', 'text': 'stub reply'}], 'stop_reason': 'end_turn'}
+
+
+class StubAnthropic:
+    def __init__(self, respond: Optional[Callable[[dict], dict]] = None, latency: float = 0.0,
+                 batch_delay: float = 0.0, batch_outcome: Optional[Callable[[str], Optional[str]]] = None,
+                 requests_per_second: Optional[int] = None, overload_rate: float = 0.0, token_delay: float = 0.0):
+        self.respond = respond or text_reply
+        self.latency = latency
+        self.token_delay = token_delay
+        self.requests_per_second = requests_per_second
+        self.overload_rate = overload_rate
+        self.throttled = 0
+        self._recent = []
+        self.batch_delay = batch_delay
+        self.batch_outcome = batch_outcome or (lambda custom_id: None)
+        self.requests = []
+        self.batches = {}
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def usage_for(self, params: dict) -> dict:
+        segments = _segments(params)
+        breakpoint = max((i for i, s in enumerate(segments) if isinstance(s, dict) and s.get('cache_control')),
+                         default=-1)
+        total = sum(estimate_tokens(s) for s in segments)
+        usage = {'input_tokens': total, 'output_tokens': 0,
+                 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+        if breakpoint < 0:
+            return usage
+        prefix = segments[:breakpoint + 1]
+        prefix_tokens = sum(estimate_tokens(s) for s in prefix)
+        if prefix_tokens < min_cacheable_tokens(params.get('model')):
+            return usage
+        key = hashlib.sha256(json.dumps([params.get('model'), prefix], sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            hit = key in self._cached_prefixes
+            self._cached_prefixes.add(key)
+        usage['input_tokens'] = total - prefix_tokens
+        usage['cache_read_input_tokens' if hit else 'cache_creation_input_tokens'] = prefix_tokens
+        return usage
+
+    def handle(self, path: str, params: dict):
+        """Return (status, headers, body) for one request."""
+        if path == '/v1/messages/batches':
+            return 200, {}, self.create_batch(params['requests'])
+        parts = path.strip('/').split('/')
+        if len(parts) == 5 and parts[4] == 'cancel' and parts[3] in self.batches:
+            batch, _ = self.batches[parts[3]]
+            with self._lock:
+                if batch['processing_status'] == 'in_progress':
+                    batch['processing_status'] = 'canceling'
+                    batch['cancel_initiated_at'] = datetime.now(timezone.utc).isoformat()
+                return 200, {}, dict(batch)
+        if path != '/v1/messages':
+            return 404, {}, {'type': 'error', 'error': {'type': 'not_found_error', 'message': path}}
+        error, headers = self.throttle()
+        if error:
+            return error
+        status, extra, body = self.reply(params)
+        if params.get('stream'):
+            return status, {**headers, **extra, 'content-type': 'text/event-stream'}, self.events(body)
+        # Generation takes as long as it would have taken to stream.
+        time.sleep(self.token_delay * sum(len(_deltas(block)) for block in body['content']))
+        return status, {**headers, **extra}, body
+
+    def throttle(self):
+        """(error, rate-limit headers): the error is a 429 past `requests_per_second`,
+        a random 529 at `overload_rate`, or None."""
+        headers = {}
+        with self._lock:
+            if self.requests_per_second:
+                now = time.monotonic()
+                self._recent = [t for t in self._recent if now - t < 1.0]
+                remaining = self.requests_per_second - len(self._recent)
+                headers['anthropic-ratelimit-requests-limit'] = str(self.requests_per_second * 60)
+                headers['anthropic-ratelimit-requests-remaining'] = str(max(0, remaining - 1))
+                if remaining <= 0:
+                    self.throttled += 1
+                    headers['retry-after'] = str(math.ceil(1.0 - (now - self._recent[0])))
+                    return (429, headers, {'type': 'error', 'error': {'type': 'rate_limit_error',
+                                                                      'message': 'stub rate limit'}}), headers
+                self._recent.append(now)
+            if random.random() < self.overload_rate:
+                self.throttled += 1
+                return (529, {}, {'type': 'error', 'error': {'type': 'overloaded_error',
+                                                             'message': 'stub overloaded'}}), headers
+        return None, headers
+
+    def reply(self, params: dict):
+        with self._lock:
+            self.requests.append(params)
+        if self.latency:
+            time.sleep(self.latency)
+        reply = self.respond(params)
+        usage = self.usage_for(params)
+        usage['output_tokens'] = estimate_tokens(reply['content'])
+        body = {
+            'id': f"msg_{uuid.uuid4().hex[:24]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': params.get('model', 'stub'),
+            'stop_sequence': None,
+            'usage': usage,
+            **reply,
+        }
+        return 200, {}, body
+
+    def start(self) -> 'StubAnthropic':
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('content-length') or 0)
+                params = json.loads(self.rfile.read(length) or b'{}')
+                status, headers, body = stub.handle(self.path.split('?')[0], params)
+                self._send(status, headers, body)
+
+            def do_GET(self):
+                status, headers, body = stub.handle_get(self.path.split('?')[0])
+                self._send(status, headers, body)
+
+            def _send(self, status, headers, body):
+                if not isinstance(body, (bytes, dict, list)):
+                    return self._send_chunked(status, headers, body)
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('content-type', headers.pop('content-type', 'application/json'))
+                self.send_header('content-length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunked(self, status, headers, chunks):
+                self.send_response(status)
+                self.send_header('transfer-encoding', 'chunked')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def events(self, message: dict):
+        """The server-sent events of a streamed `message`, one word or JSON fragment per delta."""
+        def event(kind, data):
+            return f"event: {kind}\ndata: {json.dumps({'type': kind, **data})}\n\n".encode()
+
+        usage = message['usage']
+        yield event('message_start', {'message': dict(message, content=[], stop_reason=None,
+                                                      usage=dict(usage, output_tokens=1))})
+        for index, block in enumerate(message['content']):
+            empty = dict(block, input={}) if block['type'] == 'tool_use' else dict(block, text='')
+            yield event('content_block_start', {'index': index, 'content_block': empty})
+            for delta in _deltas(block):
+                time.sleep(self.token_delay)
+                yield event('content_block_delta', {'index': index, 'delta': delta})
+            yield event('content_block_stop', {'index': index})
+        yield event('message_delta', {'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+                                      'usage': {'output_tokens': usage['output_tokens']}})
+        yield event('message_stop', {})
+
+    def create_batch(self, requests: list) -> dict:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        now = datetime.now(timezone.utc).isoformat()
+        batch = {
+            'id': batch_id, 'type': 'message_batch', 'processing_status': 'in_progress',
+            'request_counts': {'processing': len(requests), 'succeeded': 0, 'errored': 0, 'canceled': 0, 'expired': 0},
+            'created_at': now, 'expires_at': now, 'ended_at': None, 'cancel_initiated_at': None,
+            'archived_at': None, 'results_url': None,
+        }
+        with self._lock:
+            self.batches[batch_id] = (batch, [])
+        threading.Thread(target=self._run_batch, args=(batch_id, requests), daemon=True).start()
+        return batch
+
+    def _run_batch(self, batch_id: str, requests: list) -> None:
+        batch, results = self.batches[batch_id]
+        for request in requests:
+            time.sleep(self.batch_delay / max(1, len(requests)))
+            outcome = 'canceled' if batch['cancel_initiated_at'] else self.batch_outcome(request['custom_id'])
+            if outcome == 'errored':
+                result = {'type': 'errored', 'error': {'type': 'error', 'error': {'type': 'api_error',
+                                                                               'message': 'stub failure'}}}
+            elif outcome in ('canceled', 'expired'):
+                result = {'type': outcome}
+            else:
+                result = {'type': 'succeeded', 'message': self.reply(request['params'])[2]}
+            with self._lock:
+                results.append({'custom_id': request['custom_id'], 'result': result})
+                batch['request_counts']['processing'] -= 1
+                batch['request_counts'][result['type']] += 1
+        with self._lock:
+            batch['processing_status'] = 'ended'
+            batch['ended_at'] = datetime.now(timezone.utc).isoformat()
+            batch['results_url'] = f"{self.base_url}/v1/messages/batches/{batch_id}/results"
+
+    def handle_get(self, path: str):
+        parts = path.strip('/').split('/')
+        if parts[:3] == ['v1', 'messages', 'batches'] and len(parts) in (4, 5) and parts[3] in self.batches:
+            batch, results = self.batches[parts[3]]
+            with self._lock:
+                if len(parts) == 4:
+                    return 200, {}, dict(batch)
+                if parts[4] == 'results' and batch['processing_status'] == 'ended':
+                    lines = ''.join(json.dumps(result) + '\n' for result in results)
+                    return 200, {'content-type': 'application/x-jsonl'}, lines.encode()
+        return 404, {}, {'type': 'error', 'error': {'type': 'not_found_error', 'message': path}}
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'StubAnthropic':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
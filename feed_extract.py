@@ -0,0 +1,149 @@
+import html
+import re
+from typing import Callable, List, Optional
+
+# Elements that never hold article prose. Dropped with their contents before
+# anything else, so their text cannot leak into the extracted body.
+BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'iframe', 'form', 'button', 'select',
+                    'nav', 'header', 'footer', 'aside', 'figure')
+
+# Tag patterns use `[^<>]*` so no match attempt runs past the next tag: a
+# page full of unclosed tags still takes one linear pass.
+_BOILERPLATE_TAG_RE = re.compile(r'<(/?)(%s)\b[^<>]*>' % '|'.join(BOILERPLATE_TAGS), re.I)
+_BLOCK_RE = re.compile(r'</?(?:p|div|section|h[1-6]|li|ul|ol|blockquote|pre|tr|td|table|br|hr|dd|dt)\b[^<>]*>', re.I)
+_LINK_TAG_RE = re.compile(r'<(/?)a\b[^<>]*>', re.I)
+_TAG_RE = re.compile(r'<[^<>]*>')
+_SPACE_RE = re.compile(r'\s+')
+_SENTENCE_END_RE = re.compile(r'[.!?]["\')\]]?\s')
+
+
+def _strip_comments(page: str) -> str:
+    parts, pos = [], 0
+    while True:
+        start = page.find('<!--', pos)
+        end = page.find('-->', start + 4) if start >= 0 else -1
+        if end < 0:
+            parts.append(page[pos:])
+            return ' '.join(parts)
+        parts.append(page[pos:start])
+        pos = end + 3
+
+
+def _strip_boilerplate(page: str) -> str:
+    """Drop boilerplate elements with their contents, in one pass over the tags.
+
+    Each closing tag pairs with the latest open one of the same name; an
+    opening tag never closed is left alone, as is a stray closing tag.
+    """
+    stack, open_count, spans = [], {}, []
+    for tag in _BOILERPLATE_TAG_RE.finditer(page):
+        name = tag.group(2).lower()
+        if not tag.group(1):
+            if not tag.group(0).endswith('/>'):
+                stack.append((name, tag.start()))
+                open_count[name] = open_count.get(name, 0) + 1
+        elif open_count.get(name):
+            # Openers above the match were never closed; they end up inside its span.
+            while True:
+                top, start = stack.pop()
+                open_count[top] -= 1
+                if top == name:
+                    break
+            spans.append((start, tag.end()))
+    if not spans:
+        return page
+    parts, pos = [], 0
+    for start, end in sorted(spans):
+        if end <= pos:
+            continue  # nested inside a span already dropped
+        parts.append(page[pos:max(pos, start)])
+        pos = end
+    parts.append(page[pos:])
+    return ' '.join(parts)
+
+
+def _container(page: str) -> str:
+    # Pages that mark up their body with <article> or <main> get just that.
+    for tag in ('article', 'main'):
+        start = re.search(r'<%s\b[^>]*>' % tag, page, re.I)
+        if start:
+            end = page.lower().rfind(f'</{tag}')
+            if end > start.end():
+                return page[start.end():end]
+    body = re.search(r'<body\b[^>]*>', page, re.I)
+    return page[body.end():] if body else page
+
+
+def _text(fragment: str) -> str:
+    return _SPACE_RE.sub(' ', html.unescape(_TAG_RE.sub(' ', fragment))).strip()
+
+
+def _is_prose(block: str, text: str, min_words: int, max_link_density: float) -> bool:
+    if len(text.split()) < min_words:
+        return False
+    linked, opened = 0, None
+    for tag in _LINK_TAG_RE.finditer(block):
+        if not tag.group(1):
+            opened = tag.end()
+        elif opened is not None:
+            linked += len(_text(block[opened:tag.start()]))
+            opened = None
+    return linked <= max_link_density * len(text)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def truncate_to_tokens(blocks: List[str], max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+    """Join whole blocks until `max_tokens`, then cut the last one at a sentence end,
+    or at a word boundary if no sentence fits."""
+    kept, used = [], 0
+    for block in blocks:
+        tokens = count_tokens(block)
+        if used + tokens <= max_tokens:
+            kept.append(block)
+            used += tokens
+            continue
+        # Trim the overflowing block to whole sentences that still fit.
+        room = max_tokens - used
+        cut = 0
+        for match in _SENTENCE_END_RE.finditer(block):
+            if count_tokens(block[:match.end()]) > room:
+                break
+            cut = match.end()
+        if not cut:
+            # No sentence fits: keep the most whole words that do (binary search over word ends).
+            ends = [match.start() for match in _SPACE_RE.finditer(block)] + [len(block)]
+            lo, hi = 0, len(ends)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if count_tokens(block[:ends[mid]]) <= room:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            cut = ends[lo - 1] if lo else 0
+        if cut:
+            kept.append(block[:cut].rstrip())
+        break
+    return '\n\n'.join(kept)
+
+
+def extract_main_text(page: str, max_tokens: Optional[int] = 3000, min_words: int = 8,
+                      max_link_density: float = 0.5, count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+    """The main article text of an HTML page, as paragraphs separated by blank lines.
+
+    Scripts, styles, navigation, headers, footers and asides are dropped; the
+    rest is split into block-level elements and only prose-like blocks (at
+    least `min_words` words, mostly not link text) are kept. The result is cut
+    to `max_tokens` by `count_tokens` (default: ~4 characters per token).
+    """
+    page = _strip_boilerplate(_strip_comments(page))
+    blocks = []
+    for block in _BLOCK_RE.split(_container(page)):
+        text = _text(block)
+        if text and _is_prose(block, text, min_words, max_link_density):
+            blocks.append(text)
+    if max_tokens is None:
+        return '\n\n'.join(blocks)
+    return truncate_to_tokens(blocks, max_tokens, count_tokens)
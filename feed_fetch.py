@@ -0,0 +1,143 @@
+import asyncio
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+USER_AGENT = "Mozilla/5.0 (compatible; newsletter-bot/1.0)"
+
+
+class FetchResult:
+    def __init__(self, url: str, status: int = 0, content: bytes = b"", encoding: Optional[str] = None,
+                 headers: Optional[dict] = None, truncated: bool = False, error: Optional[str] = None):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers or {}
+        self.truncated = truncated
+        self.error = error
+        self.from_cache = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and 200 <= self.status < 300
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def __repr__(self) -> str:
+        return f"FetchResult({self.url!r}, status={self.status}, bytes={len(self.content)}, error={self.error!r})"
+
+
+class Fetcher:
+    """Concurrent HTTP GETs over one pooled, keep-alive async client.
+
+    At most `max_connections` requests run at once and at most `per_host` to
+    any single host. Each request gets `connect_timeout` / `read_timeout`, an
+    overall `total_timeout`, and bodies are cut off after `max_bytes`.
+    Failures come back as results with `error` set instead of raising. With
+    an HttpCache as `cache`, requests are conditional and 304s come from disk.
+
+        async with Fetcher() as fetcher:
+            async for item, result in fetcher.fetch_many(items, url=lambda i: i.url):
+                ...
+    """
+
+    def __init__(self, max_connections: int = 64, per_host: int = 6, connect_timeout: float = 5.0,
+                 read_timeout: float = 10.0, total_timeout: float = 30.0, max_bytes: int = 5 * 2**20,
+                 client: Optional[httpx.AsyncClient] = None, cache=None):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.client = client
+        self.cache = cache
+        self._owns_client = client is None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def __aenter__(self) -> 'Fetcher':
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                headers={'user-agent': USER_AGENT},
+                follow_redirects=True,
+            )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def _get(self, url: str, headers: Optional[dict] = None) -> FetchResult:
+        async with self.client.stream('GET', url, headers=headers) as response:
+            body = bytearray()
+            truncated = False
+            async for data in response.aiter_bytes():
+                body.extend(data)
+                if len(body) > self.max_bytes:
+                    del body[self.max_bytes:]
+                    truncated = True
+                    break
+            return FetchResult(str(response.url), response.status_code, bytes(body), response.encoding,
+                               dict(response.headers), truncated)
+
+    async def fetch(self, url: str, headers: Optional[dict] = None) -> FetchResult:
+        if self.cache is not None:
+            headers = {**(headers or {}), **self.cache.validators(url)}
+        # Per host first: tasks queued behind one busy host must not sit on global slots other hosts could use.
+        async with self._host_slot(url), self._slots:
+            try:
+                result = await asyncio.wait_for(self._get(url, headers), self.total_timeout)
+            except asyncio.TimeoutError:
+                return FetchResult(url, error=f"timed out after {self.total_timeout}s")
+            except httpx.HTTPError as e:
+                return FetchResult(url, error=f"{type(e).__name__}: {e}")
+        return self.cache.resolve(url, result) if self.cache is not None else result
+
+    async def fetch_many(self, items: Iterable, url: Callable = lambda item: item) -> AsyncIterator[Tuple[object, FetchResult]]:
+        """Yield (item, result) pairs in completion order, not input order."""
+        async def one(item):
+            return item, await self.fetch(url(item))
+
+        tasks = [asyncio.ensure_future(one(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_url(url: str, cache=None, timeout: float = 10.0, max_bytes: int = 20 * 2**20) -> FetchResult:
+    """Blocking single GET with the same timeouts, body cap and optional HttpCache."""
+    headers = {'user-agent': USER_AGENT}
+    if cache is not None:
+        headers.update(cache.validators(url))
+    try:
+        with httpx.Client(timeout=timeout, follow_redirects=True) as client:
+            with client.stream('GET', url, headers=headers) as response:
+                body = bytearray()
+                for data in response.iter_bytes():
+                    body.extend(data)
+                    if len(body) > max_bytes:
+                        break
+                truncated = len(body) > max_bytes
+                result = FetchResult(str(response.url), response.status_code, bytes(body[:max_bytes]),
+                                     response.encoding, dict(response.headers), truncated)
+    except httpx.HTTPError as e:
+        return FetchResult(url, error=f"{type(e).__name__}: {e}")
+    return cache.resolve(url, result) if cache is not None else result
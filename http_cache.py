@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+from feed_fetch import FetchResult
+
+
+class HttpCache:
+    """On-disk HTTP cache that revalidates with conditional GETs.
+
+    Responses carrying an ETag or Last-Modified are stored as a body file plus
+    a small JSON header file. The next request for the URL sends
+    If-None-Match / If-Modified-Since, and a 304 is answered from disk.
+    `stats()` reports how many requests were revalidated and the bytes saved.
+    """
+
+    def __init__(self, directory: str = '.http_cache'):
+        self.directory = directory
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _entry(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._path(url) + '.json', 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def validators(self, url: str) -> dict:
+        """Conditional request headers for `url`, empty if nothing is cached."""
+        entry = self._entry(url)
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['if-none-match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['if-modified-since'] = entry['last_modified']
+        return headers
+
+    def resolve(self, url: str, result: FetchResult) -> FetchResult:
+        """Serve a 304 from disk, or store a fresh cacheable 200."""
+        with self._lock:
+            self.requests += 1
+            self.bytes_downloaded += len(result.content)
+        if result.status == 304:
+            entry = self._entry(url)
+            try:
+                with open(self._path(url) + '.body', 'rb') as f:
+                    content = f.read()
+            except OSError:
+                return result
+            with self._lock:
+                self.not_modified += 1
+                self.bytes_saved += len(content)
+            cached = FetchResult(result.url, 200, content, entry.get('encoding'), result.headers)
+            cached.from_cache = True
+            return cached
+
+        etag = result.headers.get('etag')
+        last_modified = result.headers.get('last-modified')
+        if result.status == 200 and not result.truncated and (etag or last_modified):
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(url)
+            with open(path + '.body.tmp', 'wb') as f:
+                f.write(result.content)
+            os.replace(path + '.body.tmp', path + '.body')
+            entry = {'url': url, 'etag': etag, 'last_modified': last_modified, 'encoding': result.encoding}
+            with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(path + '.json.tmp', path + '.json')
+        return result
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'bytes_downloaded': self.bytes_downloaded,
+            'bytes_saved': self.bytes_saved,
+        }
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from anthropic.types import Message
+
+
+def _jsonable(value):
+    # Conversation histories hold SDK content blocks as well as plain dicts.
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(exclude_none=True)
+    raise TypeError(f"cannot hash {type(value).__name__} in request params")
+
+
+def request_key(params: dict) -> str:
+    """Canonical hash of a messages.create request: model, system, messages, tools, sampling."""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=_jsonable)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of Messages API responses with TTL and size-based LRU eviction.
+
+    Safe to share between threads. `hits`, `misses` and `stats()` report how
+    much it saved since it was opened.
+    """
+
+    def __init__(self, path: str = '.llm_cache/responses.sqlite', ttl: float = 7 * 24 * 3600,
+                 max_bytes: int = 256 * 2**20):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                used REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.db.commit()
+        self._bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Message]:
+        with self._lock:
+            row = self.db.execute("SELECT body, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[2] > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= row[1]
+                self.db.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+        return Message.model_validate_json(row[0])
+
+    def put(self, key: str, message: Message) -> None:
+        body = message.model_dump_json()
+        size = len(body.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses (key, body, size, created, used) VALUES (?, ?, ?, ?, ?)",
+                            (key, body, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self) -> None:
+        # Expired entries first, then least recently used until under budget.
+        expired = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses WHERE created < ?",
+                                  (time.time() - self.ttl,)).fetchone()[0]
+        self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._bytes -= expired
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+            if self._bytes <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bytes -= size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'bytes': self._bytes,
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> ResponseCache:
+    """The process-wide cache, under $LLM_CACHE_DIR (default .llm_cache/)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            directory = os.environ.get('LLM_CACHE_DIR', '.llm_cache')
+            _default_cache = ResponseCache(os.path.join(directory, 'responses.sqlite'))
+        return _default_cache
+
+
+def cached_create(client, cache: Optional[ResponseCache] = None, usage=None, **params) -> Message:
+    """client.messages.create(**params), answered from `cache` when seen before.
+
+    `usage` (a UsageStats) records the token usage of real API calls only;
+    responses served from the cache cost nothing and are not counted.
+    """
+    cache = cache or default_cache()
+    key = request_key(params)
+    message = cache.get(key)
+    if message is None:
+        message = client.messages.create(**params)
+        if usage is not None:
+            usage.record(message)
+        cache.put(key, message)
+    return message
+
+
+def cached_stream(client, on_text, cache: Optional[ResponseCache] = None, usage=None, **params) -> Message:
+    """Like `cached_create`, but streams: `on_text` gets each text delta as it arrives.
+
+    A cached response is passed to `on_text` in one piece. Streamed and
+    non-streamed calls with the same params share cache entries.
+    """
+    cache = cache or default_cache()
+    key = request_key(params)
+    message = cache.get(key)
+    if message is not None:
+        for block in message.content:
+            if block.type == 'text':
+                on_text(block.text)
+        return message
+    with client.messages.stream(**params) as stream:
+        for text in stream.text_stream:
+            on_text(text)
+        message = stream.get_final_message()
+    if usage is not None:
+        usage.record(message)
+    cache.put(key, message)
+    return message
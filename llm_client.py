@@ -0,0 +1,304 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import anthropic
+
+# Statuses worth retrying: timeouts, conflicts, rate limits, server errors and 529 "overloaded".
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+THROTTLE_STATUSES = {429, 529}
+
+
+def estimate_tokens(params: dict) -> int:
+    return len(json.dumps(params, default=str)) // 4
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute` / 60 per second, up to `per_minute`.
+
+    `take(n)` blocks until `n` are available, waking early when `adjust` or
+    `observe` hands tokens back. The level may go negative when a request
+    turns out bigger than estimated, which delays later takers.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n: float) -> None:
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= n:
+                    self.level -= n
+                    return
+                self._lock.wait((n - self.level) / self.rate)
+
+    def adjust(self, n: float) -> None:
+        """Charge `n` more (or refund, if negative) once the real cost is known."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - n)
+            if n < 0:
+                self._lock.notify_all()
+
+    def observe(self, remaining: float, limit: Optional[float] = None) -> None:
+        # The server's limit replaces ours, up or down; its remaining allowance wins when lower than ours.
+        with self._lock:
+            self._refill()
+            if limit is not None and limit > 0 and limit != self.capacity:
+                self.capacity = limit
+                self.rate = limit / 60.0
+                self.level = min(self.level, self.capacity)
+            self.level = min(self.level, remaining)
+            self._lock.notify_all()
+
+
+class AdaptiveLimit:
+    """Concurrency limit that grows by one per window of successes and halves on throttling (AIMD)."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._decreased = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> 'AdaptiveLimit':
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def succeeded(self) -> None:
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify()
+
+    def throttled(self) -> None:
+        # Errors from requests already in flight arrive together; halve once per cooldown.
+        with self._cond:
+            now = time.monotonic()
+            if now - self._decreased >= self.cooldown:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._decreased = now
+
+
+class RateLimitedClient:
+    """An `anthropic.Anthropic` that paces itself against the account's rate limits.
+
+    Requests, input tokens and output tokens per minute each have a token
+    bucket, which follows the limits and remaining allowance the
+    `anthropic-ratelimit-*` response headers report. Output is charged at the
+    average output of recent calls (capped at `max_tokens`) and settled
+    against real usage afterwards; failed attempts are refunded. Throttled (429/529), failed and timed-out
+    calls are retried with jittered exponential backoff, honouring
+    `retry-after`, and the number of concurrent calls adapts: it grows while
+    calls succeed and halves when the API pushes back.
+
+    Only `messages.create` and `messages.stream` are paced; everything else on
+    `messages` (batches, count_tokens, ...) goes straight to the underlying
+    client, with the SDK's own retries.
+    """
+
+    def __init__(self, client: Optional[anthropic.Anthropic] = None, requests_per_minute: float = 50,
+                 input_tokens_per_minute: float = 50_000, output_tokens_per_minute: float = 10_000,
+                 max_concurrency: int = 16, max_retries: int = 8, backoff: float = 0.5, max_backoff: float = 60.0,
+                 **client_options):
+        self.sdk_client = client or anthropic.Anthropic(**client_options)
+        # Paced calls are retried here, with the limiter in the loop, not inside the SDK.
+        self.client = self.sdk_client.with_options(max_retries=0)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.input_bucket = TokenBucket(input_tokens_per_minute)
+        self.output_bucket = TokenBucket(output_tokens_per_minute)
+        self.concurrency = AdaptiveLimit(max(1, max_concurrency // 4), maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.output_estimate = 256.0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.messages = _Messages(self)
+
+    def _pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_for_pause(self) -> None:
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _observe(self, headers) -> None:
+        for name, bucket in (('requests', self.request_bucket), ('input-tokens', self.input_bucket),
+                             ('output-tokens', self.output_bucket)):
+            remaining = headers.get(f'anthropic-ratelimit-{name}-remaining')
+            limit = headers.get(f'anthropic-ratelimit-{name}-limit')
+            if remaining is not None:
+                try:
+                    bucket.observe(float(remaining), float(limit) if limit is not None else None)
+                except ValueError:
+                    pass
+
+    def _retry_delay(self, attempt: int, headers) -> float:
+        retry_after = headers.get('retry-after') if headers is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # "Full jitter": spreads out clients that failed at the same moment.
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _charges(self, params: dict):
+        """The (input, output) tokens to take before a call; `_settle` corrects them."""
+        output = min(params.get('max_tokens', 0), self.output_estimate)
+        return estimate_tokens(params), output
+
+    def _refund(self, charges) -> None:
+        self.request_bucket.adjust(-1)
+        self.input_bucket.adjust(-charges[0])
+        self.output_bucket.adjust(-charges[1])
+
+    def _request(self, params: dict, send):
+        """Pace and retry `send()`, one attempt returning (result, response headers).
+
+        Returns the result and the (input, output) charges of the attempt that succeeded.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_pause()
+            charges = self._charges(params)
+            self.request_bucket.take(1)
+            self.input_bucket.take(charges[0])
+            self.output_bucket.take(charges[1])
+            result = error = headers = None
+            try:
+                result, headers = send()
+            except anthropic.APIStatusError as e:
+                error, headers = e, e.response.headers
+            except anthropic.APIConnectionError as e:  # includes timeouts
+                error = e
+            with self._lock:
+                self.calls += 1
+            if error is not None:
+                # Refunded first, so the allowance the headers report has the last word.
+                self._refund(charges)
+            if headers is not None:
+                self._observe(headers)
+
+            if error is None:
+                self.concurrency.succeeded()
+                return result, charges
+
+            status = getattr(error, 'status_code', None)
+            if (status is not None and status not in RETRY_STATUSES) or attempt == self.max_retries:
+                raise error
+            delay = self._retry_delay(attempt, headers)
+            with self._lock:
+                self.retries += 1
+                if status in THROTTLE_STATUSES:
+                    self.throttled += 1
+            if status in THROTTLE_STATUSES:
+                self.concurrency.throttled()
+                # Everyone backs off, not just the caller that was told to.
+                self._pause(delay)
+            else:
+                time.sleep(delay)
+
+    def _settle(self, charges, usage) -> None:
+        # Replace the estimates taken up front with what the request really used.
+        self.input_bucket.adjust(usage.input_tokens + (usage.cache_creation_input_tokens or 0) - charges[0])
+        self.output_bucket.adjust(usage.output_tokens - charges[1])
+        with self._lock:
+            self.output_estimate = max(1.0, 0.8 * self.output_estimate + 0.2 * usage.output_tokens)
+
+    def create(self, **params):
+        def send():
+            with self.concurrency:
+                raw = self.client.messages.with_raw_response.create(**params)
+                return raw.parse(), raw.headers
+
+        message, charges = self._request(params, send)
+        self._settle(charges, message.usage)
+        return message
+
+    @contextmanager
+    def stream(self, **params):
+        """`messages.stream(**params)`, paced like `create`.
+
+        Only opening the stream is retried; the concurrency slot is held
+        until the stream is closed.
+        """
+        with self.concurrency:
+            def send():
+                manager = self.client.messages.stream(**params)
+                return (manager, manager.__enter__()), None
+
+            (manager, stream), charges = self._request(params, send)
+            self._observe(stream.response.headers)
+            try:
+                yield stream
+            finally:
+                manager.__exit__(None, None, None)
+            snapshot = stream.current_message_snapshot
+            if snapshot.stop_reason is not None:
+                self._settle(charges, snapshot.usage)
+
+    def stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'concurrency': int(self.concurrency.limit),
+        }
+
+
+class _Messages:
+    def __init__(self, owner: RateLimitedClient):
+        self._owner = owner
+
+    def create(self, **params):
+        return self._owner.create(**params)
+
+    def stream(self, **params):
+        return self._owner.stream(**params)
+
+    def __getattr__(self, name):
+        return getattr(self._owner.sdk_client.messages, name)
+
+
+_clients: Dict[str, RateLimitedClient] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(api_key: Optional[str] = None, **options) -> RateLimitedClient:
+    """The process-wide rate-limited client for `api_key`, created on first use."""
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = RateLimitedClient(api_key=api_key, **options)
+        return _clients[api_key]
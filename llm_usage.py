@@ -0,0 +1,65 @@
+import threading
+
+
+class UsageStats:
+    """Running token totals from `response.usage`, including prompt-cache reads and writes."""
+
+    FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+    def __init__(self):
+        self.calls = 0
+        self.totals = {field: 0 for field in self.FIELDS}
+        self._lock = threading.Lock()
+
+    def record(self, response) -> None:
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        with self._lock:
+            self.calls += 1
+            for field in self.FIELDS:
+                self.totals[field] += getattr(usage, field, None) or 0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """Share of prompt-cacheable input tokens that were read from the cache."""
+        read = self.totals['cache_read_input_tokens']
+        written = self.totals['cache_creation_input_tokens']
+        return read / (read + written) if read + written else 0.0
+
+    def summary(self) -> dict:
+        return {'calls': self.calls, **self.totals, 'cache_hit_rate': self.cache_hit_rate}
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class LatencyStats:
+    """Time to first token and total latency of model calls, in seconds.
+
+    For a non-streaming call the first token is only seen with the whole
+    response, so both are the same.
+    """
+
+    def __init__(self):
+        self.ttft = []
+        self.total = []
+        self._lock = threading.Lock()
+
+    def record(self, ttft: float, total: float) -> None:
+        with self._lock:
+            self.ttft.append(ttft)
+            self.total.append(total)
+
+    def summary(self) -> dict:
+        return {
+            'calls': len(self.total),
+            'ttft_p50': percentile(self.ttft, 50),
+            'ttft_p95': percentile(self.ttft, 95),
+            'total_p50': percentile(self.total, 50),
+            'total_p95': percentile(self.total, 95),
+        }
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement.
+_BATCH = 500
+
+
+def chunk_hash(chunk: str) -> bytes:
+    return hashlib.sha256(chunk.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model name, sha256 of the chunk text).
+
+    Entries are evicted least-recently-used first once there are more than
+    `max_entries`. Hit and miss counts are kept for the lifetime of the object.
+    """
+
+    def __init__(self, path: str, model: str, max_entries: int = 2_000_000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self.db.commit()
+        self._count = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        for i in range(0, len(hashes), _BATCH):
+            batch = hashes[i:i + _BATCH]
+            rows = self.db.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                [self.model, *batch],
+            )
+            for h, vector in rows:
+                found[h] = np.frombuffer(vector, dtype=np.float32)
+        if found:
+            now = time.time()
+            self.db.executemany("UPDATE embeddings SET used = ? WHERE model = ? AND hash = ?",
+                                [(now, self.model, h) for h in found])
+            self.db.commit()
+        self.hits += len(found)
+        self.misses += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, hashes: Iterable[bytes], vectors: np.ndarray) -> None:
+        now = time.time()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        before = self.db.total_changes
+        self.db.executemany(
+            "INSERT OR IGNORE INTO embeddings (model, hash, vector, used) VALUES (?, ?, ?, ?)",
+            [(self.model, h, v.tobytes(), now) for h, v in zip(hashes, vectors)],
+        )
+        self._count += self.db.total_changes - before
+        if self._count > self.max_entries:
+            self.evict(self._count - self.max_entries)
+        self.db.commit()
+
+    def evict(self, n: int) -> None:
+        """Drop the `n` least recently used entries."""
+        before = self.db.total_changes
+        self.db.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY used LIMIT ?)", (n,)
+        )
+        self._count -= self.db.total_changes - before
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class LRUCache:
+    """Small thread-safe in-memory LRU map with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: object) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -0,0 +1,60 @@
+import threading
+from typing import Dict, Tuple
+
+# Encoders are loaded on first use and shared by every SimpleRag in the process,
+# keyed by (model name, mode). Importing this module does not import torch.
+_encoders: Dict[Tuple[str, str], object] = {}
+_tokenizers: Dict[str, object] = {}
+_lock = threading.Lock()
+
+MODES = ('fp32', 'int8', 'onnx', 'onnx-int8')
+
+
+def _load(model_name: str, mode: str):
+    from sentence_transformers import SentenceTransformer
+
+    if mode == 'fp32':
+        return SentenceTransformer(model_name)
+    if mode == 'int8':
+        # Dynamic quantization: Linear weights stored as int8, activations
+        # quantized on the fly. CPU only; no export step or extra dependency.
+        import torch
+        model = SentenceTransformer(model_name, device='cpu')
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if mode in ('onnx', 'onnx-int8'):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError as e:
+            raise ImportError(f"encoder mode {mode!r} needs `pip install optimum[onnxruntime]`") from e
+        if mode == 'onnx':
+            return SentenceTransformer(model_name, device='cpu', backend='onnx')
+        # Pre-quantized exports ship with the common sentence-transformers models.
+        return SentenceTransformer(model_name, device='cpu', backend='onnx',
+                                   model_kwargs={'file_name': 'onnx/model_qint8_avx512_vnni.onnx'})
+    raise ValueError(f"unknown encoder mode {mode!r}, expected one of {MODES}")
+
+
+def get_encoder(model_name: str = 'all-MiniLM-L6-v2', mode: str = 'fp32'):
+    """Return the shared encoder for `model_name` in `mode`, loading it on first call."""
+    key = (model_name, mode)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        with _lock:
+            encoder = _encoders.get(key)
+            if encoder is None:
+                encoder = _encoders[key] = _load(model_name, mode)
+    return encoder
+
+
+def get_tokenizer(model_name: str = 'all-MiniLM-L6-v2'):
+    """The model's tokenizer alone, for counting tokens without loading the model."""
+    tokenizer = _tokenizers.get(model_name)
+    if tokenizer is None:
+        with _lock:
+            tokenizer = _tokenizers.get(model_name)
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+                # Same short-name resolution as SentenceTransformer(model_name).
+                repo = model_name if '/' in model_name else f'sentence-transformers/{model_name}'
+                tokenizer = _tokenizers[model_name] = AutoTokenizer.from_pretrained(repo)
+    return tokenizer
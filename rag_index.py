@@ -0,0 +1,440 @@
+import json
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from rag_store import _replace
+
+# Rows are processed in blocks this size whenever the whole matrix has to be
+# scanned, so temporaries stay small even for memory-mapped multi-GB stores.
+BLOCK_ROWS = 65536
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+# Set bits per byte value, for Hamming distances where numpy lacks bitwise_count (< 2.0).
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    return _POPCOUNT[x]
+
+
+def _inverse_norms(embeddings: np.ndarray, start: int = 0) -> np.ndarray:
+    out = np.empty(len(embeddings) - start, dtype=np.float32)
+    for i in range(start, len(embeddings), BLOCK_ROWS):
+        block = np.asarray(embeddings[i:i + BLOCK_ROWS], dtype=np.float32)
+        out[i - start:i - start + len(block)] = 1.0 / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+    return out
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top k of a 2d score matrix, best first, via partial selection."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((len(scores), 0), dtype=np.float32), np.empty((len(scores), 0), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape)
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def score_rows(embeddings: np.ndarray, queries: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Exact cosine scores of `queries` against only the rows `ids` (sorted for locality)."""
+    rows = np.asarray(embeddings[ids], dtype=np.float32)
+    norms = np.maximum(np.linalg.norm(rows, axis=1), 1e-12)
+    return (_normalize(np.atleast_2d(queries)) @ rows.T) / norms
+
+
+def _pad(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Searches return fixed (nq, k) arrays; missing results have id -1.
+    if scores.shape[1] >= k:
+        return scores, ids
+    missing = k - scores.shape[1]
+    scores = np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf)
+    ids = np.pad(ids, ((0, 0), (0, missing)), constant_values=-1)
+    return scores, ids
+
+
+class BruteForceIndex:
+    """Exact cosine search: one matrix multiply over every row, then partial top k."""
+
+    def __init__(self):
+        self.count = 0
+        self.generation = 0
+        self._embeddings = None
+        self._inv_norms = np.empty(0, dtype=np.float32)
+
+    def sync(self, store) -> None:
+        embeddings = store.embeddings
+        generation = getattr(store, 'generation', 0)
+        if len(embeddings) < self.count or generation != self.generation:
+            self.count, self._inv_norms = 0, np.empty(0, dtype=np.float32)
+            self.generation = generation
+        if len(embeddings) > self.count:
+            self._inv_norms = np.concatenate([self._inv_norms, _inverse_norms(embeddings, self.count)])
+            self.count = len(embeddings)
+        self._embeddings = embeddings
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _normalize(np.atleast_2d(queries))
+        if self.count == 0:
+            return _pad(np.empty((len(queries), 0), np.float32), np.empty((len(queries), 0), np.int64), k)
+        scores = np.empty((len(queries), self.count), dtype=np.float32)
+        for i in range(0, self.count, BLOCK_ROWS):
+            block = np.asarray(self._embeddings[i:i + BLOCK_ROWS], dtype=np.float32)
+            scores[:, i:i + len(block)] = (queries @ block.T) * self._inv_norms[i:i + len(block)]
+        return _pad(*top_k(scores, k), k)
+
+    def save(self, path: str) -> None:
+        pass
+
+    def load(self, path: str) -> bool:
+        return False
+
+
+class IVFIndex:
+    """Inverted-file approximate search.
+
+    Vectors are clustered with spherical k-means into `n_lists` cells; a query
+    only scores the rows in its `nprobe` closest cells. Raising `nprobe` trades
+    latency for recall. `n_lists` defaults to about sqrt(N), so the work per
+    query grows far slower than the corpus. The index retrains itself when the
+    store has grown `retrain_factor` times past the size it was trained on.
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, nprobe: int = 8,
+                 train_iters: int = 10, train_per_list: int = 64,
+                 retrain_factor: float = 4.0, seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.train_per_list = train_per_list
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self._reset()
+
+    def _reset(self) -> None:
+        self.count = 0
+        self.generation = 0
+        self.trained_count = 0
+        self.centroids = None
+        self._embeddings = None
+        self._inv_norms = np.empty(0, dtype=np.float32)
+        self._assign = np.empty(0, dtype=np.int32)
+        self._list_ids = np.empty(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+
+    def _train(self, embeddings: np.ndarray) -> None:
+        n = len(embeddings)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.seed)
+        sample_ids = np.sort(rng.choice(n, size=min(n, n_lists * self.train_per_list), replace=False))
+        sample = _normalize(embeddings[sample_ids])
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(self.train_iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+        self.centroids = centroids
+        self.trained_count = n
+
+    def _assign_rows(self, embeddings: np.ndarray, start: int) -> np.ndarray:
+        out = np.empty(len(embeddings) - start, dtype=np.int32)
+        for i in range(start, len(embeddings), BLOCK_ROWS):
+            block = np.asarray(embeddings[i:i + BLOCK_ROWS], dtype=np.float32)
+            out[i - start:i - start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def _rebuild_lists(self) -> None:
+        self._list_ids = np.argsort(self._assign, kind='stable')
+        counts = np.bincount(self._assign, minlength=len(self.centroids))
+        self._list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def sync(self, store) -> None:
+        embeddings = store.embeddings
+        generation = getattr(store, 'generation', 0)
+        n = len(embeddings)
+        if n == 0:
+            self._reset()
+            self.generation = generation
+            return
+        self._embeddings = embeddings
+        if len(self._inv_norms) != self.count and self.count <= n:
+            # Loaded from an index saved without its norms.
+            self._inv_norms = _inverse_norms(embeddings[:self.count])
+        if n == self.count and generation == self.generation:
+            return
+
+        if generation != self.generation and self.centroids is not None and n < self.retrain_factor * self.trained_count:
+            # Rows were removed: the centroids are still good, the assignments are not.
+            self._inv_norms = _inverse_norms(embeddings)
+            self._assign = self._assign_rows(embeddings, 0)
+        elif n < self.count or self.centroids is None or n >= self.retrain_factor * self.trained_count:
+            self._train(embeddings)
+            self._inv_norms = _inverse_norms(embeddings)
+            self._assign = self._assign_rows(embeddings, 0)
+        else:
+            self._inv_norms = np.concatenate([self._inv_norms, _inverse_norms(embeddings, self.count)])
+            self._assign = np.concatenate([self._assign, self._assign_rows(embeddings, self.count)])
+        self.count = n
+        self.generation = generation
+        self._rebuild_lists()
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _normalize(np.atleast_2d(queries))
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.count == 0:
+            return out_scores, out_ids
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        _, probes = top_k(queries @ self.centroids.T, nprobe)
+        for qi, query in enumerate(queries):
+            ids = np.concatenate([
+                self._list_ids[self._list_offsets[c]:self._list_offsets[c + 1]] for c in probes[qi]
+            ])
+            if len(ids) == 0:
+                continue
+            ids.sort()
+            rows = np.asarray(self._embeddings[ids], dtype=np.float32)
+            scores = (rows @ query) * self._inv_norms[ids]
+            best_scores, best = top_k(scores[None, :], k)
+            out_scores[qi, :best.shape[1]] = best_scores[0]
+            out_ids[qi, :best.shape[1]] = ids[best[0]]
+        return out_scores, out_ids
+
+    def save(self, path: str) -> None:
+        if self.centroids is None:
+            return
+        _replace(os.path.join(path, 'ivf_centroids.npy'), lambda f: np.save(f, self.centroids))
+        _replace(os.path.join(path, 'ivf_assign.npy'), lambda f: np.save(f, self._assign))
+        # Norms are saved too: recomputing them on load would read every page of the embeddings.
+        _replace(os.path.join(path, 'ivf_inv_norms.npy'), lambda f: np.save(f, self._inv_norms))
+        _replace(os.path.join(path, 'ivf.json'), lambda f: f.write(json.dumps(
+            {'count': self.count, 'trained_count': self.trained_count}).encode('utf-8')))
+
+    def load(self, path: str) -> bool:
+        meta_path = os.path.join(path, 'ivf.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.centroids = np.load(os.path.join(path, 'ivf_centroids.npy'))
+        self._assign = np.load(os.path.join(path, 'ivf_assign.npy'))
+        self.trained_count = meta['trained_count']
+        self.count = meta['count']
+        self._rebuild_lists()
+        norms_path = os.path.join(path, 'ivf_inv_norms.npy')
+        if os.path.exists(norms_path):
+            self._inv_norms = np.load(norms_path, mmap_mode='r')
+        else:
+            # Saved before norms were: sync() recomputes them.
+            self._inv_norms = np.empty(0, dtype=np.float32)
+        return True
+
+
+class _CompressedIndex:
+    """Two-stage search over compressed codes.
+
+    A coarse pass scores every row from a compact code kept in memory, then the
+    best `k * rescore` rows are rescored with their exact float32 vectors, read
+    from the store (for a loaded store, straight from the memory-mapped file).
+    Subclasses define the code: `_fit` learns its parameters from a sample,
+    `_encode` turns float rows into codes and `_coarse` scores codes.
+    """
+
+    name = None
+    # Codes are decoded a cache-sized block at a time during the coarse pass.
+    coarse_block = 4096
+
+    def __init__(self, rescore: int = 4, train_size: int = 100000, seed: int = 0):
+        self.rescore = rescore
+        self.train_size = train_size
+        self.seed = seed
+        self.count = 0
+        self.generation = 0
+        self.codes = None
+        self._embeddings = None
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.codes is None else self.codes.nbytes
+
+    def _encode_rows(self, embeddings: np.ndarray, start: int) -> np.ndarray:
+        blocks = []
+        for i in range(start, len(embeddings), BLOCK_ROWS):
+            blocks.append(self._encode(_normalize(embeddings[i:i + BLOCK_ROWS])))
+        return np.concatenate(blocks)
+
+    def sync(self, store) -> None:
+        embeddings = store.embeddings
+        generation = getattr(store, 'generation', 0)
+        n = len(embeddings)
+        self._embeddings = embeddings
+        if n == self.count and generation == self.generation:
+            return
+        if n == 0:
+            self.count, self.codes = 0, None
+        elif self.codes is None or n < self.count or generation != self.generation:
+            rng = np.random.default_rng(self.seed)
+            sample = np.sort(rng.choice(n, size=min(n, self.train_size), replace=False))
+            self._fit(_normalize(embeddings[sample]))
+            self.codes = self._encode_rows(embeddings, 0)
+        else:
+            self.codes = np.concatenate([self.codes, self._encode_rows(embeddings, self.count)])
+        self.count = n
+        self.generation = generation
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _normalize(np.atleast_2d(queries))
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.count == 0:
+            return out_scores, out_ids
+
+        coarse = np.empty((len(queries), self.count), dtype=np.float32)
+        prepared = self._prepare(queries)
+        block = self._block_rows(len(queries))
+        for i in range(0, self.count, block):
+            coarse[:, i:i + block] = self._coarse(self.codes[i:i + block], prepared)
+        _, shortlists = top_k(coarse, k * self.rescore)
+
+        for qi, query in enumerate(queries):
+            ids = np.sort(shortlists[qi])
+            best_scores, best = top_k(score_rows(self._embeddings, query, ids), k)
+            out_scores[qi, :best.shape[1]] = best_scores[0]
+            out_ids[qi, :best.shape[1]] = ids[best[0]]
+        return out_scores, out_ids
+
+    def _block_rows(self, n_queries: int) -> int:
+        return self.coarse_block
+
+    def _prepare(self, queries: np.ndarray):
+        return queries
+
+    def _params(self) -> dict:
+        return {}
+
+    def save(self, path: str) -> None:
+        if self.codes is None:
+            return
+        # `codes` may be memory-mapped from this very file: write beside it and rename over it.
+        _replace(os.path.join(path, f'{self.name}_codes.npy'), lambda f: np.save(f, self.codes))
+        _replace(os.path.join(path, f'{self.name}_params.npz'), lambda f: np.savez(f, **self._params()))
+        _replace(os.path.join(path, f'{self.name}.json'),
+                 lambda f: f.write(json.dumps({'count': self.count}).encode('utf-8')))
+
+    def load(self, path: str) -> bool:
+        meta_path = os.path.join(path, f'{self.name}.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.count = json.load(f)['count']
+        self.codes = np.load(os.path.join(path, f'{self.name}_codes.npy'), mmap_mode='r')
+        with np.load(os.path.join(path, f'{self.name}_params.npz')) as params:
+            for key in params.files:
+                setattr(self, key, params[key])
+        return True
+
+
+class Int8Index(_CompressedIndex):
+    """Scalar quantization: one int8 per dimension, 4x smaller than float32."""
+
+    name = 'int8'
+    # Small enough that the float32 copy of a block stays in L2 between the cast and the matmul.
+    coarse_block = 512
+
+    def _fit(self, sample: np.ndarray) -> None:
+        # Per-dimension scale from a high percentile, so rare outliers clip
+        # instead of wasting resolution for every other row.
+        self.scale = np.maximum(np.percentile(np.abs(sample), 99.9, axis=0), 1e-6).astype(np.float32) / 127
+
+    def _encode(self, rows: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(rows / self.scale), -127, 127).astype(np.int8)
+
+    def _prepare(self, queries: np.ndarray):
+        # One float32 buffer per search, reused by every block instead of a fresh astype() copy.
+        return queries * self.scale, np.empty((self.coarse_block, len(self.scale)), dtype=np.float32)
+
+    def _coarse(self, codes: np.ndarray, prepared) -> np.ndarray:
+        queries, buffer = prepared
+        rows = buffer[:len(codes)]
+        np.copyto(rows, codes, casting='unsafe')
+        return queries @ rows.T
+
+    def _params(self) -> dict:
+        return {'scale': self.scale}
+
+
+class BinaryIndex(_CompressedIndex):
+    """Sign-bit codes: one bit per dimension, 32x smaller than float32.
+
+    Bits are taken after subtracting the mean vector, which spreads them far
+    better than raw signs for sentence embeddings. The coarse pass is the
+    Hamming distance between the query's code and each row's, a popcount of
+    their XOR. That ranks more coarsely than the float vectors do, so a long
+    shortlist (`rescore=100`) is rescored exactly; the rescore reads only
+    `k * rescore` rows, which is cheap next to scanning every code.
+    """
+
+    name = 'binary'
+    coarse_block = 65536
+    # Bytes of XOR temporaries per coarse block: (rows x queries x code bytes), made twice.
+    coarse_bytes = 8 * 2**20
+
+    def __init__(self, rescore: int = 100, **options):
+        super().__init__(rescore=rescore, **options)
+
+    def _fit(self, sample: np.ndarray) -> None:
+        self.mean = sample.mean(axis=0).astype(np.float32)
+
+    def _encode(self, rows: np.ndarray) -> np.ndarray:
+        return np.packbits(rows > self.mean, axis=1)
+
+    def _block_rows(self, n_queries: int) -> int:
+        code_bytes = self.codes.shape[1]
+        return max(1, min(self.coarse_block, self.coarse_bytes // (n_queries * code_bytes)))
+
+    def _prepare(self, queries: np.ndarray) -> np.ndarray:
+        return self._encode(queries)
+
+    def _coarse(self, codes: np.ndarray, query_codes: np.ndarray) -> np.ndarray:
+        distances = _popcount(codes[:, None, :] ^ query_codes[None, :, :]).sum(axis=2, dtype=np.int32)
+        # Higher scores rank first.
+        return -distances.T
+
+    def _params(self) -> dict:
+        return {'mean': self.mean}
+
+
+INDEXES = {
+    'exact': BruteForceIndex,
+    'ivf': IVFIndex,
+    'int8': Int8Index,
+    'binary': BinaryIndex,
+}
+
+
+def make_index(kind: str = 'exact', **options):
+    if kind not in INDEXES:
+        raise ValueError(f"unknown index {kind!r}, expected one of {sorted(INDEXES)}")
+    return INDEXES[kind](**options)
@@ -0,0 +1,183 @@
+import glob
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from rag_cache import chunk_hash
+
+
+def iter_files(paths: Union[str, Iterable[str]], suffixes: Optional[Tuple[str, ...]] = None) -> Iterator[str]:
+    """Expand files, directories (recursively) and glob patterns into file paths.
+
+    Files found through a directory or glob are kept only if they end with one
+    of `suffixes`; explicitly named files are always kept.
+    """
+    def wanted(name):
+        return suffixes is None or name.lower().endswith(suffixes)
+
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if wanted(name):
+                        yield os.path.normpath(os.path.join(root, name))
+        elif os.path.isfile(path):
+            yield os.path.normpath(path)
+        else:
+            for match in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(match) and wanted(match):
+                    yield os.path.normpath(match)
+
+
+def iter_batches(files: Iterable[str], chunk_file: Callable[[str], Iterable[str]],
+                 batch_size: int) -> Iterator[Tuple[List[str], List[str]]]:
+    """Group the chunks of a stream of files into (sources, chunks) batches."""
+    sources, chunks = [], []
+    for file in files:
+        for chunk in chunk_file(file):
+            sources.append(file)
+            chunks.append(chunk)
+            if len(chunks) >= batch_size:
+                yield sources, chunks
+                sources, chunks = [], []
+    if chunks:
+        yield sources, chunks
+
+
+# Each pool worker loads its own copy of the model once, in the initializer.
+_worker_encoder = None
+
+
+def _init_worker(model_name: str, encoder_mode: str) -> None:
+    global _worker_encoder
+    import torch
+    from rag_encoder import get_encoder
+    # One intra-op thread per process: the pool already uses every core.
+    torch.set_num_threads(1)
+    _worker_encoder = get_encoder(model_name, encoder_mode)
+
+
+def _encode_batch(chunks: List[str]) -> np.ndarray:
+    return np.asarray(_worker_encoder.encode(chunks), dtype=np.float32)
+
+
+class IngestProgress:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.chunks = 0
+        self.cached = 0
+        self.removed = 0
+        self.last_source = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / max(self.elapsed, 1e-9)
+
+    def __str__(self) -> str:
+        return (f"{self.files} files, {self.chunks} chunks ({self.cached} cached) in {self.elapsed:.1f}s "
+                f"({self.chunks_per_sec:.0f} chunks/s), {self.removed} removed")
+
+
+def print_progress(progress: IngestProgress, every: float = 5.0) -> None:
+    now = time.perf_counter()
+    if now - getattr(progress, '_printed', 0.0) >= every:
+        progress._printed = now
+        print(f"ingest: {progress}")
+
+
+def _split_cached(cache, chunks: List[str], dim: Optional[int]):
+    """Fill what the cache knows; return (vectors or None, hashes, indices still to encode)."""
+    if cache is None:
+        return None, None, list(range(len(chunks)))
+    hashes = [chunk_hash(c) for c in chunks]
+    found = cache.get_many(hashes)
+    if not found:
+        return None, hashes, list(range(len(chunks)))
+    dim = dim or len(next(iter(found.values())))
+    vectors = np.empty((len(chunks), dim), dtype=np.float32)
+    missing = []
+    for i, h in enumerate(hashes):
+        if h in found:
+            vectors[i] = found[h]
+        else:
+            missing.append(i)
+    return vectors, hashes, missing
+
+
+def ingest(store, encode: Callable[[List[str]], np.ndarray], batches: Iterable[Tuple[List[str], List[str]]],
+           model_name: Optional[str] = None, encoder_mode: str = 'fp32', workers: int = 1, max_pending: Optional[int] = None,
+           cache=None, progress: Optional[Callable[[IngestProgress], None]] = print_progress) -> IngestProgress:
+    """Encode batches of chunks and append them to `store`, in order.
+
+    With `workers` > 1 batches are encoded in a process pool, each worker
+    holding its own `model_name` encoder in `encoder_mode`. At most `max_pending` batches
+    (default 2 per worker) are in flight, so memory stays bounded by the batch
+    size rather than the corpus size. Chunks found in `cache` (an
+    EmbeddingCache) skip the encoder. `progress` is called after every batch.
+    """
+    stats = IngestProgress()
+
+    def commit(sources, chunks, vectors, hashes, missing, encoded):
+        if vectors is None:
+            vectors = encoded if encoded is not None else np.empty((0, store.dim or 0), dtype=np.float32)
+        elif missing:
+            vectors[missing] = encoded
+        if cache is not None and missing:
+            if hashes is None:
+                hashes = [chunk_hash(c) for c in chunks]
+            cache.put_many([hashes[i] for i in missing], vectors[missing])
+        store.add(vectors, sources, chunks)
+        stats.chunks += len(chunks)
+        stats.cached += len(chunks) - len(missing)
+        for source in sources:
+            if source != stats.last_source:
+                stats.files += 1
+                stats.last_source = source
+        if progress:
+            progress(stats)
+
+    def prepare(chunks):
+        vectors, hashes, missing = _split_cached(cache, chunks, store.dim)
+        return vectors, hashes, missing, [chunks[i] for i in missing]
+
+    if workers <= 1:
+        for sources, chunks in batches:
+            vectors, hashes, missing, todo = prepare(chunks)
+            encoded = np.asarray(encode(todo), dtype=np.float32) if todo else None
+            commit(sources, chunks, vectors, hashes, missing, encoded)
+        return stats
+
+    if model_name is None:
+        raise ValueError("model_name is required to encode in worker processes")
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+
+    def finish_oldest():
+        sources, chunks, vectors, hashes, missing, future = pending.popleft()
+        commit(sources, chunks, vectors, hashes, missing, future.result() if future else None)
+
+    # spawn, not fork: a forked copy of an initialised torch runtime can deadlock.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(model_name, encoder_mode)) as pool:
+        for sources, chunks in batches:
+            if len(pending) >= max_pending:
+                finish_oldest()
+            vectors, hashes, missing, todo = prepare(chunks)
+            future = pool.submit(_encode_batch, todo) if todo else None
+            pending.append((sources, chunks, vectors, hashes, missing, future))
+        while pending:
+            finish_oldest()
+    return stats
@@ -0,0 +1,137 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Words, plus dotted/hyphenated/apostrophe runs kept whole so that tickers
+# (BRK.B), ids (a1-b2) and names (O'Neil) match as single terms.
+TOKEN_RE = re.compile(r"\w+(?:[.'\-]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over the store's chunks, kept as a term -> postings inverted index.
+
+    Postings are (row ids, term frequencies) arrays. Rows added since the last
+    search are buffered per term and merged only for the terms a query touches.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+
+    def _reset(self) -> None:
+        self.count = 0
+        self.generation = 0
+        self.total_len = 0
+        self.doc_lens = np.empty(0, dtype=np.int32)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._pending: Dict[str, Tuple[List[int], List[int]]] = {}
+
+    def sync(self, store) -> None:
+        generation = getattr(store, 'generation', 0)
+        if len(store) < self.count or generation != self.generation:
+            self._reset()
+            self.generation = generation
+        if len(store) == self.count:
+            return
+        new_lens = []
+        for row in range(self.count, len(store)):
+            terms = Counter(tokenize(store.chunks[row]))
+            for term, tf in terms.items():
+                ids, tfs = self._pending.setdefault(term, ([], []))
+                ids.append(row)
+                tfs.append(tf)
+            new_lens.append(sum(terms.values()))
+        self.doc_lens = np.concatenate([self.doc_lens, np.asarray(new_lens, dtype=np.int32)])
+        self.total_len += int(sum(new_lens))
+        self.count = len(store)
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        pending = self._pending.pop(term, None)
+        ids, tfs = self.postings.get(term, (np.empty(0, np.int64), np.empty(0, np.int32)))
+        if pending:
+            ids = np.concatenate([ids, np.asarray(pending[0], dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.asarray(pending[1], dtype=np.int32)])
+            self.postings[term] = (ids, tfs)
+        return ids, tfs
+
+    def scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(row ids, scores) of every row sharing at least one term with `query`."""
+        if self.count == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        avg_len = self.total_len / self.count
+        scores = np.zeros(self.count, dtype=np.float32)
+        touched = []
+        for term in set(tokenize(query)):
+            ids, tfs = self._postings(term)
+            if len(ids) == 0:
+                continue
+            idf = np.log(1 + (self.count - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[ids] / avg_len)
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            touched.append(ids)
+        if not touched:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        ids = np.unique(np.concatenate(touched))
+        return ids, scores[ids]
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k (scores, row ids), best first."""
+        ids, scores = self.scores(query)
+        if len(ids) > k:
+            part = np.argpartition(scores, len(ids) - k)[len(ids) - k:]
+            ids, scores = ids[part], scores[part]
+        order = np.argsort(-scores, kind='stable')
+        return scores[order], ids[order]
+
+    def save(self, path: str) -> None:
+        for term in list(self._pending):
+            self._postings(term)
+        terms = sorted(self.postings)
+        lengths = np.array([len(self.postings[t][0]) for t in terms], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        empty = (np.empty(0, np.int64), np.empty(0, np.int32))
+        ids = np.concatenate([self.postings[t][0] for t in terms] or [empty[0]])
+        tfs = np.concatenate([self.postings[t][1] for t in terms] or [empty[1]])
+        np.save(os.path.join(path, 'bm25_ids.npy'), ids)
+        np.save(os.path.join(path, 'bm25_tfs.npy'), tfs)
+        np.save(os.path.join(path, 'bm25_offsets.npy'), offsets)
+        np.save(os.path.join(path, 'bm25_doc_lens.npy'), self.doc_lens)
+        with open(os.path.join(path, 'bm25.json'), 'w', encoding='utf-8') as f:
+            json.dump({'count': self.count, 'total_len': self.total_len, 'terms': terms}, f)
+
+    def load(self, path: str) -> bool:
+        meta_path = os.path.join(path, 'bm25.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self._reset()
+        ids = np.load(os.path.join(path, 'bm25_ids.npy'), mmap_mode='r')
+        tfs = np.load(os.path.join(path, 'bm25_tfs.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(path, 'bm25_offsets.npy'))
+        for i, term in enumerate(meta['terms']):
+            self.postings[term] = (ids[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+        self.doc_lens = np.load(os.path.join(path, 'bm25_doc_lens.npy'))
+        self.count = meta['count']
+        self.total_len = meta['total_len']
+        return True
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuse ranked lists of row ids; returns (fused scores, row ids), best first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            if row >= 0:
+                fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank + 1)
+    rows = sorted(fused, key=fused.get, reverse=True)
+    return np.array([fused[r] for r in rows], dtype=np.float32), np.array(rows, dtype=np.int64)
@@ -0,0 +1,220 @@
+import json
+import os
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# On-disk layout of a saved store directory:
+#   meta.json          format version, model name, dim and row count
+#   embeddings.npy     contiguous float32 (count, dim) matrix, memory-mapped on load
+#   chunks.bin         utf-8 chunk texts concatenated back to back
+#   chunk_offsets.npy  int64 (count + 1) byte offsets into chunks.bin
+#   sources.json       distinct source names
+#   source_ids.npy     int32 (count,) index into sources.json per row
+
+
+class MappedStrings(Sequence[str]):
+    """Read-only list of strings decoded on access from a utf-8 blob and offsets."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class IndexedStrings(Sequence[str]):
+    """Read-only list of strings stored as ids into a small table of distinct values."""
+
+    def __init__(self, names: List[str], ids):
+        self.names = names
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.names[i] for i in self.ids[idx]]
+        return self.names[self.ids[idx]]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in self.ids:
+            yield self.names[i]
+
+
+def _replace(path: str, write) -> None:
+    # Write next to the target and rename over it, so a store that is currently
+    # memory-mapped from `path` keeps reading the old inode instead of crashing.
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class VectorStore:
+    """Embeddings plus their source and chunk text, one row per chunk.
+
+    Embeddings are kept as a contiguous float32 matrix. A store can be saved to a
+    directory and loaded back with the matrix and chunk texts memory-mapped, so
+    loading is independent of corpus size and processes share the page cache.
+    """
+
+    def __init__(self, dim: Optional[int] = None, model: Optional[str] = None):
+        self.dim = dim
+        self.model = model
+        self._blocks: List[np.ndarray] = []
+        self.sources: Sequence[str] = []
+        self.chunks: Sequence[str] = []
+        # Bumped whenever rows are removed, i.e. whenever row ids change meaning;
+        # indexes compare it to decide between an incremental update and a rebuild.
+        self.generation = 0
+        self._rows_by_source = None
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def __getitem__(self, key: str):
+        # Keeps the old `vector_store['chunks']` dict-style access working.
+        if key not in ('embeddings', 'sources', 'chunks'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        if not self._blocks:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if len(self._blocks) > 1:
+            self._blocks = [np.vstack(self._blocks)]
+        return self._blocks[0]
+
+    def add(self, embeddings, sources: List[str], chunks: List[str]) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            raise ValueError(f"expected a 2d embedding matrix, got shape {embeddings.shape}")
+        if not (len(embeddings) == len(sources) == len(chunks)):
+            raise ValueError("embeddings, sources and chunks must have the same length")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"expected embeddings of dim {self.dim}, got {embeddings.shape[1]}")
+        if len(embeddings) == 0:
+            return
+
+        # A loaded store is read-only on disk; the first write copies it into memory.
+        if not isinstance(self.sources, list):
+            self.sources = list(self.sources)
+        if not isinstance(self.chunks, list):
+            self.chunks = list(self.chunks)
+
+        start = len(self.chunks)
+        self._blocks.append(embeddings)
+        self.sources.extend(sources)
+        self.chunks.extend(chunks)
+        if self._rows_by_source is not None:
+            for i, source in enumerate(sources, start):
+                self._rows_by_source.setdefault(source, []).append(i)
+
+    def rows_of(self, source: str) -> List[int]:
+        """Row ids of every chunk that came from `source`."""
+        if self._rows_by_source is None:
+            self._rows_by_source = {}
+            for i, name in enumerate(self.sources):
+                self._rows_by_source.setdefault(name, []).append(i)
+        return list(self._rows_by_source.get(source, []))
+
+    def remove(self, ids) -> None:
+        """Drop rows by id. Remaining rows are compacted, so ids after them shift."""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(ids) == 0:
+            return
+        keep = np.ones(len(self), dtype=bool)
+        keep[ids] = False
+        self._blocks = [np.ascontiguousarray(self.embeddings[keep])]
+        self.sources = [s for s, k in zip(self.sources, keep) if k]
+        self.chunks = [c for c, k in zip(self.chunks, keep) if k]
+        self._rows_by_source = None
+        self.generation += 1
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+
+        embeddings = np.ascontiguousarray(self.embeddings, dtype=np.float32)
+        _replace(os.path.join(path, 'embeddings.npy'), lambda f: np.save(f, embeddings))
+
+        offsets = np.zeros(len(self.chunks) + 1, dtype=np.int64)
+        def write_chunks(f):
+            pos = 0
+            for i, chunk in enumerate(self.chunks):
+                data = chunk.encode('utf-8')
+                f.write(data)
+                pos += len(data)
+                offsets[i + 1] = pos
+        _replace(os.path.join(path, 'chunks.bin'), write_chunks)
+        _replace(os.path.join(path, 'chunk_offsets.npy'), lambda f: np.save(f, offsets))
+
+        names, ids = {}, np.empty(len(self.sources), dtype=np.int32)
+        for i, source in enumerate(self.sources):
+            ids[i] = names.setdefault(source, len(names))
+        _replace(os.path.join(path, 'sources.json'), lambda f: f.write(json.dumps(list(names)).encode('utf-8')))
+        _replace(os.path.join(path, 'source_ids.npy'), lambda f: np.save(f, ids))
+
+        # meta.json goes last: a directory without it is an incomplete save.
+        meta = {
+            'version': FORMAT_VERSION,
+            'model': self.model,
+            'dim': self.dim,
+            'count': len(self),
+        }
+        _replace(os.path.join(path, 'meta.json'), lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'VectorStore':
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"unsupported vector store version {meta.get('version')} in {path}")
+
+        mmap_mode = 'r' if mmap else None
+        embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(path, 'chunk_offsets.npy'), mmap_mode=mmap_mode)
+        source_ids = np.load(os.path.join(path, 'source_ids.npy'), mmap_mode=mmap_mode)
+        with open(os.path.join(path, 'sources.json'), 'r', encoding='utf-8') as f:
+            source_names = json.load(f)
+
+        blob_path = os.path.join(path, 'chunks.bin')
+        if os.path.getsize(blob_path) == 0:
+            blob = b''
+        elif mmap:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            with open(blob_path, 'rb') as f:
+                blob = f.read()
+
+        if not (len(embeddings) == len(offsets) - 1 == len(source_ids) == meta['count']):
+            raise ValueError(f"vector store at {path} is inconsistent with its meta.json")
+
+        store = cls(dim=meta['dim'], model=meta.get('model'))
+        if len(embeddings):
+            store._blocks = [embeddings]
+        store.chunks = MappedStrings(blob, offsets)
+        store.sources = IndexedStrings(source_names, source_ids)
+        return store
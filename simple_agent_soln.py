@@ -1,131 +1,158 @@
-import os, json, anthropic
+import time
+from concurrent.futures import ThreadPoolExecutor
 from utils import ANTHROPIC_API_KEY
+from llm_cache import cached_create, cached_stream
+from llm_client import shared_client
+from llm_usage import LatencyStats, UsageStats
+from agent_history import ConversationHistory
+from agent_faq import format_sections, load_faq
+from agent_inventory import InventoryStore, default_window
+from agent_tools import MemoizedTools, ToolRegistry
+
+# The demo fleet, loaded into an empty inventory.
+DEMO_CARS = [
+    ("a1", "toronto", "honda civic 2022"),
+    ("a2", "toronto", "honda civic 2022"),
+    ("a3", "toronto", "honda civic 2022"),
+]
+
+# Tool schemas are built once, here; TravelDb methods below register themselves.
+TRAVEL_TOOLS = ToolRegistry()
+CAR_ID = {"car_id": {"type": "string"}}
 
 class TravelDb:
-    def __init__(self):
-        self.cars = {
-            "toronto": [
-                {"id": "a1", "model": "honda civic 2022"},
-                {"id": "a2", "model": "honda civic 2022"},
-                {"id": "a3", "model": "honda civic 2022"}
-            ]
-        }
-        self.bookings = {}
-        self.faq = open("car_rental_faq.md").read()
-
-    def list_car_rental(self, location: str, time: str):
-        if location.lower() not in self.cars:
-            return f"we have no stocks of cars at {location}"
-        return self.cars[location.lower()]
+    def __init__(self, store=None):
+        # Inventory and bookings live in SQLite; sessions can share one store.
+        self.store = store or InventoryStore()
+        if self.store.count_cars() == 0:
+            self.store.add_cars(DEMO_CARS)
+        # Parsed into question/answer sections and indexed once per process.
+        self.faq, self.faq_index = load_faq("car_rental_faq.md")
+        self.handlers = TRAVEL_TOOLS.bind(self)
+
+    @TRAVEL_TOOLS.tool("List cars free to rent for a day from the given time", {
+        "time": {"type": "string", "description": "ISO 8601 date or datetime, default now"},
+        "location": {"type": "string"},
+    }, required=["location"])
+    def list_car_rental(self, location: str, time: str = None):
+        try:
+            start, end = default_window(time, None)
+        except ValueError:
+            return f"could not read time {time!r}, use ISO 8601 like 2025-03-20T10:00"
+        cars = self.store.available(location, start, end)
+        if not cars:
+            if not self.store.has_location(location):
+                return f"we have no stocks of cars at {location}"
+            return f"every car at {location} is booked on {start:%Y-%m-%d %H:%M}"
+        return cars
 
+    @TRAVEL_TOOLS.tool("Get car rental info", CAR_ID, required=["car_id"])
     def get_car_rental(self, car_id):
-        if car_id not in self.bookings:
+        bookings = self.store.bookings(car_id)
+        if not bookings:
             return f"we have no booking for id {car_id}"
-        return self.bookings[car_id]
+        return bookings
     
-    def book_car_rental(self, car_id):
-        self.bookings[car_id] = True
+    @TRAVEL_TOOLS.tool("Book a car rental", {
+        **CAR_ID,
+        "start": {"type": "string", "description": "ISO 8601, default now"},
+        "end": {"type": "string", "description": "ISO 8601, default a day after start"},
+    }, required=["car_id"], side_effect=True)
+    def book_car_rental(self, car_id, start=None, end=None):
+        try:
+            start, end = default_window(start, end)
+            booking = self.store.book(car_id, start, end)
+        except ValueError as e:
+            return f"could not book {car_id}: {e}"
+        except KeyError:
+            return f"we have no car with id {car_id}"
+        if booking is None:
+            return f"{car_id} is already booked between {start:%Y-%m-%d %H:%M} and {end:%Y-%m-%d %H:%M}"
+        return f"booked {car_id} from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} (booking {booking})"
 
+    @TRAVEL_TOOLS.tool("Cancel a car rental", CAR_ID, required=["car_id"], side_effect=True)
     def cancel_car_rental(self, car_id):
-        self.bookings[car_id] = False
+        cancelled = self.store.cancel(car_id)
+        if not cancelled:
+            return f"we have no booking for id {car_id}"
+        return f"cancelled {cancelled} booking(s) for {car_id}"
 
     def get_faq(self):
         return self.faq
 
+    @TRAVEL_TOOLS.tool("Move the bookings of a car to another car", {
+        **CAR_ID,
+        "new_car_id": {"type": "string"},
+    }, required=["car_id", "new_car_id"], side_effect=True)
     def change_car_rental(self, car_id, new_car_id):
-        self.cars[new_car_id] = self.cars[car_id]
-        del self.cars[car_id]
+        try:
+            moved = self.store.change(car_id, new_car_id)
+        except KeyError:
+            return f"we have no car with id {new_car_id}"
+        except ValueError as e:
+            return str(e)
+        if not moved:
+            return f"we have no booking for id {car_id}"
+        return f"moved {moved} booking(s) from {car_id} to {new_car_id}"
 
     def has_side_effect(self, tool_name):
-        return tool_name in [
-            "book_car_rental",
-            "cancel_car_rental"
-        ]
+        return tool_name in TRAVEL_TOOLS.side_effects
+
+    def memoizable(self, tool_name, tool_input):
+        # Without a time the listing is for "now", which keeps moving.
+        return not (tool_name == "list_car_rental" and not tool_input.get("time"))
+
+    def writes(self):
+        return self.store.writes
 
     def tools_call(self, tool_name, tool_input):
-        if tool_name == "list_car_rental":
-            return self.list_car_rental(tool_input["location"], tool_input["time"])
-        elif tool_name == "get_car_rental":
-            return self.get_car_rental(tool_input["car_id"])
-        elif tool_name == "book_car_rental":
-            return self.book_car_rental(tool_input["car_id"])
-        elif tool_name == "cancel_car_rental":
-            return self.cancel_car_rental(tool_input["car_id"])
+        handler = self.handlers.get(tool_name)
+        if handler is None:
+            raise ValueError(f"unknown tool {tool_name}")
+        return handler(**tool_input)
 
     def tools(self):
-        return [
-            {
-                "name": "list_car_rental",
-                "description": "List car rental info",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "time": {"type": "string"},
-                        "location": {"type": "string"},
-                    },
-                    "required": ["location"]
-                }
-            },
-            {
-                "name": "get_car_rental",
-                "description": "Get car rental info",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "car_id": {"type": "string"}
-                    },
-                    "required": ["car_id"]
-                }
-            },
-            {
-                "name": "book_car_rental",
-                "description": "Book a car rental",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "car_id": {"type": "string"}
-                    },
-                    "required": ["car_id"]
-                }
-            },
-            {
-                "name": "cancel_car_rental",
-                "description": "Cancel a car rental",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "car_id": {"type": "string"}
-                    },
-                    "required": ["car_id"]
-                }
-            },
-            {
-                "name": "faq",
-                "description": "Answer a question based on the FAQ",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string"}
-                    },
-                    "required": ["query"]
-                }
-            }
-        ]
+        return TRAVEL_TOOLS.schemas
+
+# Answered by the agent itself (see SomeCarRentalAi.simple_faq_query).
+TRAVEL_TOOLS.declare("faq", "Answer a question based on the FAQ", {"query": {"type": "string"}}, required=["query"])
 
 
 class SomeCarRentalAi:
-    def __init__(self):
-        self.db = TravelDb()
-        self.msgs = []
+    def __init__(self, client=None, history_tokens=8000, keep_turns=4, max_steps=10, faq_sections=3,
+                 store=None, confirm=None, verbose=True):
+        # `store` is the InventoryStore to share with other sessions; `confirm(question) -> bool`
+        # replaces the `input()` prompt for side-effect tools.
+        self.db = TravelDb(store)
+        self.on_confirm = confirm
+        self.verbose = verbose
         self.model = "claude-3-5-haiku-latest"
         self.max_tokens = 2000
         self.temperature = 0.1
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.max_steps = max_steps
+        self.faq_sections = faq_sections
+        self.client = client or shared_client(ANTHROPIC_API_KEY)
+        self.usage = UsageStats()
+        self.latency = LatencyStats()
+        # Older turns are summarised or dropped once the history passes `history_tokens`.
+        self.history = ConversationHistory(max_tokens=history_tokens, keep_turns=keep_turns)
+        # Other sessions sharing the store also invalidate the memo, through its write counter.
+        self.tools = MemoizedTools(self.dispatch, self.db.has_side_effect, self.db.writes, self.db.memoizable)
+
+    @property
+    def msgs(self):
+        return self.history.messages
 
     def reset(self):
-        self.msgs = []
-        self.db = TravelDb()
+        self.history = ConversationHistory(max_tokens=self.history.max_tokens, keep_turns=self.history.keep_turns)
+        self.db = TravelDb(self.db.store)
+        # Other sessions sharing the store also invalidate the memo, through its write counter.
+        self.tools = MemoizedTools(self.dispatch, self.db.has_side_effect, self.db.writes, self.db.memoizable)
         
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
     # wait for user input
     def get_confirmation(self, query):
         user_input = input(query)
@@ -134,22 +161,37 @@ class SomeCarRentalAi:
         else:
             return False
 
-    def simple_faq_query(self, query):
-        faq = self.db.get_faq()
-        sys_prompt = f"""
+    def simple_faq_query(self, query, on_text=None):
+        # A question that plainly matches one FAQ entry gets its answer verbatim, without a model call.
+        direct = self.db.faq_index.direct_answer(query)
+        if direct is not None:
+            if on_text is not None:
+                on_text(direct.answer)
+            return direct.answer
+        hits = self.db.faq_index.search(query, self.faq_sections)
+        if not hits:
+            if on_text is not None:
+                on_text("I don't know")
+            return "I don't know"
+
+        sys_prompt = """
         You are a helpful assistant that can answer questions about the car rental FAQ.
-        Here is the FAQ:
-        {faq}
+        Answer only from the FAQ sections given with the question.
+        If you don't know the answer, or are not sure, say "I don't know".
         """
 
+        # Only the few best-matching sections are sent, not the whole FAQ.
         user_prompt = f"""
-        Please answer the following question based on the provided FAQ. 
-        If you don't know the answer, or are not sure, say "I don't know".
-        
+        FAQ sections:
+        {format_sections([section for _, section in hits])}
+
+        Please answer the following question based on the FAQ sections above.
+
         {query}
         """
 
-        response = self.client.messages.create(
+        # The prompt is a few sections now, far below the minimum the API caches: no cache_control.
+        params = dict(
             model=self.model,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
@@ -157,58 +199,141 @@ class SomeCarRentalAi:
             messages=[
                 {"role": "user", "content": user_prompt}],
         )
+        # With `on_text`, the answer is streamed to it as it is generated.
+        if on_text is not None:
+            response = cached_stream(self.client, on_text, usage=self.usage, **params)
+        else:
+            response = cached_create(self.client, usage=self.usage, **params)
         return response.content[0].text
 
-    def query(self, query):
-        if query:
-            self.msgs.append({
-                "role": "user",
-                "content": query
-            })
+    def dispatch(self, name, tool_input):
+        if name == "faq":
+            return self.simple_faq_query(tool_input["query"])
+        return self.db.tools_call(name, tool_input)
+
+    def call_tool(self, name, tool_input):
+        # Read-only results are reused within the session until a side-effect tool runs.
+        return self.tools.call(name, tool_input)
 
-        response = self.client.messages.create(
+    def confirm(self, tool_use):
+        if not self.db.has_side_effect(tool_use.name):
+            return True
+        return (self.on_confirm or self.get_confirmation)(f"Are you sure you want to {tool_use.name} {tool_use.input}?")
+
+    def run_tool(self, tool_use, approved=True):
+        """One tool call as a tool_result block; declined or failing calls get an error result."""
+        if not approved:
+            return {"type": "tool_result", "tool_use_id": tool_use.id, "is_error": True,
+                    "content": "The user declined this action."}
+        self.log(f"calling {tool_use.name} with {tool_use.input}")
+        try:
+            result = self.call_tool(tool_use.name, tool_use.input)
+        except Exception as e:
+            return {"type": "tool_result", "tool_use_id": tool_use.id, "is_error": True,
+                    "content": f"{type(e).__name__}: {e}"}
+        self.log(f"calling {tool_use.name} with {tool_use.input}, got: {result}")
+        return {"type": "tool_result", "tool_use_id": tool_use.id, "content": str(result)}
+
+    def run_tools(self, tool_uses):
+        """Run every tool call of one turn; returns their tool_result blocks in order.
+
+        Side-effect tools are confirmed one at a time first, so the model sees
+        a declined call as an error result. They then run one after another in
+        the order the model gave them, while the read-only calls run alongside
+        in parallel.
+        """
+        approved = [self.confirm(tool_use) for tool_use in tool_uses]
+        if len(tool_uses) == 1:
+            return [self.run_tool(tool_uses[0], approved[0])]
+        results = [None] * len(tool_uses)
+        with ThreadPoolExecutor(max_workers=len(tool_uses)) as pool:
+            reads = {i: pool.submit(self.run_tool, tool_use, approved[i]) for i, tool_use in enumerate(tool_uses)
+                     if not self.db.has_side_effect(tool_use.name)}
+            for i, tool_use in enumerate(tool_uses):
+                if i not in reads:
+                    results[i] = self.run_tool(tool_use, approved[i])
+            for i, future in reads.items():
+                results[i] = future.result()
+        return results
+
+    def _request(self):
+        self.history.compact()
+        system = self.history.system()
+        return dict(
             model=self.model,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
             messages=self.msgs,
-            tools=self.db.tools()
+            tools=self.db.tools(),
+            **({"system": system} if system else {})
         )
 
-        if response.stop_reason == "tool_use":
-            tool_use = next(block for block in response.content if block.type == "tool_use")
-            tool_name = tool_use.name
-            tool_input = tool_use.input
+    def _record(self, response):
+        self.usage.record(response)
+        self.history.record(response.usage)
+        if response.content:
+            self.history.append("assistant", response.content)
+        return [block for block in response.content if block.type == "tool_use"]
+
+    def query(self, query):
+        if query:
+            self.history.append("user", query)
+
+        # One model round trip per step; all tool calls of a step go back in one message.
+        for _ in range(self.max_steps):
+            started = time.perf_counter()
+            response = self.client.messages.create(**self._request())
+            elapsed = time.perf_counter() - started
+            self.latency.record(elapsed, elapsed)
 
-            if self.db.has_side_effect(tool_use.name):
-                wait_for_confirmation = self.get_confirmation(f"Are you sure you want to {tool_use.name} {tool_input}?")
-                if not wait_for_confirmation:
+            tool_uses = self._record(response)
+            if response.stop_reason != "tool_use" or not tool_uses:
+                final_response = next((block.text for block in response.content if hasattr(block, "text")), None)
+                self.log(final_response)
+                return final_response
+
+            self.history.append("user", self.run_tools(tool_uses))
+
+        self.log(f"stopped after {self.max_steps} steps without a final answer")
+        return None
+
+    def stream_query(self, query):
+        """Like `query`, but yields the reply text as it is generated.
+
+        Read-only tool calls start as soon as their block has streamed in,
+        while the rest of the response is still arriving; side-effect tools
+        are confirmed once the response is complete and run in order.
+        """
+        if query:
+            self.history.append("user", query)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            for _ in range(self.max_steps):
+                started = time.perf_counter()
+                first_token = None
+                running = {}
+                with self.client.messages.stream(**self._request()) as stream:
+                    for event in stream:
+                        if event.type in ("text", "input_json") and first_token is None:
+                            first_token = time.perf_counter() - started
+                        if event.type == "text":
+                            yield event.text
+                        elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                            tool_use = event.content_block
+                            if not self.db.has_side_effect(tool_use.name):
+                                running[tool_use.id] = pool.submit(self.run_tool, tool_use)
+                    response = stream.get_final_message()
+                elapsed = time.perf_counter() - started
+                self.latency.record(first_token if first_token is not None else elapsed, elapsed)
+
+                tool_uses = self._record(response)
+                if response.stop_reason != "tool_use" or not tool_uses:
                     return
+                # Side-effect tools are confirmed, then run one after another in the order given.
+                pending = [tool_use for tool_use in tool_uses if tool_use.id not in running]
+                approved = [self.confirm(tool_use) for tool_use in pending]
+                done = {tool_use.id: self.run_tool(tool_use, ok) for tool_use, ok in zip(pending, approved)}
+                self.history.append("user", [done[tool_use.id] if tool_use.id in done else running[tool_use.id].result()
+                                             for tool_use in tool_uses])
 
-            print(f"calling {tool_name} with {tool_input}")
-            self.msgs.append({
-                "role": "assistant",
-                "content": response.content
-            })
-
-            if tool_name == "faq":
-                response = self.simple_faq_query(tool_input["query"])
-            else:
-                response = self.db.tools_call(tool_name, tool_input)
-            print(f"calling {tool_name} with {tool_input}, got: {response}")
-
-            self.msgs.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": tool_use.id,
-                        "content": str(response)
-                    }
-                ]
-            })
-
-            return self.query(None)
-        
-        final_response = next((block.text for block in response.content if hasattr(block, "text")), None)
-        print(final_response)
-        return final_response
+        self.log(f"stopped after {self.max_steps} steps without a final answer")
@@ -1,70 +1,192 @@
 
 from typing import List, Dict
-import anthropic
+from llm_cache import cached_create
+from llm_client import shared_client
 
 ANTHROPIC_API_KEY = "REPLACE ME"
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-    """Split text into overlapping chunks."""
-
-    chunks = []
-    sentences = text.split('. ') 
-    current_chunk = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip() + '. '
-        sentence_length = len(sentence)
-        
-        if current_length + sentence_length > chunk_size and current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append(chunk_text)
-            overlap_text = ' '.join(current_chunk[-2:])
-            current_chunk = [overlap_text]
-            current_length = len(overlap_text)
-        
-        current_chunk.append(sentence)
-        current_length += sentence_length
-    
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    
-    return chunks
+# One rate-limited client per key, shared with the other modules.
+client = shared_client(ANTHROPIC_API_KEY)
 
 from typing import List
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from rag_store import VectorStore
+from rag_index import make_index, score_rows
+from rag_lexical import BM25Index, reciprocal_rank_fusion
+from rag_ingest import ingest, iter_batches, iter_files, print_progress
+from rag_cache import EmbeddingCache, LRUCache
+from rag_encoder import get_encoder, get_tokenizer
+from utils import iter_chunks
 
 class SimpleRag():
-    def __init__(self):
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
-        self.vector_store = {
-            'embeddings': [],
-            'sources': [],
-            'chunks': []
-        }
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', index: str = 'exact',
+                 cache_path: str = '.rag_cache/embeddings.sqlite', encoder_mode: str = 'fp32',
+                 chunk_tokens: int = 200, overlap_tokens: int = 32, query_cache_size: int = 1024,
+                 **index_options):
+        self.model_name = model_name
+        # 'fp32' is the stock model; 'int8' / 'onnx' / 'onnx-int8' are faster CPU modes.
+        self.encoder_mode = encoder_mode
+        # Chunk sizes are in encoder tokens; all-MiniLM-L6-v2 truncates past 256.
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.vector_store = VectorStore(model=model_name)
+        # Pass cache_path=None to always re-encode. Quantized modes get their own cache keys.
+        cache_key = model_name if encoder_mode == 'fp32' else f"{model_name}@{encoder_mode}"
+        self.cache = EmbeddingCache(cache_path, cache_key) if cache_path else None
+        # Recent question embeddings, so repeated questions skip the encoder.
+        self.query_cache = LRUCache(query_cache_size)
+        # 'exact' scans every chunk; 'ivf' is approximate, tuned by n_lists / nprobe.
+        self._index_spec = (index, index_options)
+        self.index = make_index(index, **index_options)
+        self.lexical = BM25Index()
 
-    def _add_to_store(self, file: str):
+    @property
+    def encoder(self):
+        # Loaded on first use and shared with every other SimpleRag on the same model.
+        return get_encoder(self.model_name, self.encoder_mode)
+
+    def _count_tokens(self, text: str) -> int:
+        return len(get_tokenizer(self.model_name).tokenize(text))
+
+    def _chunk_file(self, file: str):
         with open(file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        chunks = chunk_text(content)        
-        embeddings = self.encoder.encode(chunks)
-        self.vector_store['embeddings'].extend(embeddings)
-        self.vector_store['sources'].extend([file] * len(chunks))
-        self.vector_store['chunks'].extend(chunks)
-
-    def retrieve_context(self, q: str, k: str):
-        question_embedding = self.encoder.encode([q])[0]
-        similarities = cosine_similarity([question_embedding], self.vector_store['embeddings'])[0]
-        top_k_indices = np.argsort(similarities)[-k:][::-1]
+            for chunk in iter_chunks(f, self.chunk_tokens, self.overlap_tokens, self._count_tokens):
+                yield chunk.text
+
+    def _changed_chunks(self, file: str, dropped: List[int]):
+        # Re-ingesting a known file only yields chunks the store does not have yet;
+        # rows whose chunk is gone from the file are collected in `dropped`.
+        chunks = self._chunk_file(file)
+        rows = self.vector_store.rows_of(file)
+        if not rows:
+            yield from chunks
+            return
+        old = {}
+        for i in rows:
+            old.setdefault(self.vector_store.chunks[i], []).append(i)
+        for chunk in chunks:
+            if old.get(chunk):
+                old[chunk].pop()
+            else:
+                yield chunk
+        for stale in old.values():
+            dropped.extend(stale)
+
+    def _add_to_store(self, file: str):
+        self.ingest(file, progress=None)
+
+    def ingest(self, paths, batch_size: int = 256, workers: int = 1,
+               suffixes=('.txt', '.md'), progress=print_progress):
+        """Stream every file under `paths` (files, directories or globs) into the store.
+
+        Chunks are encoded in batches of `batch_size`, so memory stays flat however
+        large the corpus. By default they go through this instance's shared encoder;
+        `workers` > 1 spreads them over a process pool, each process loading its own
+        copy of the model, which only pays off for large corpora on many cores.
+        Files already in the store are diffed chunk by chunk, and unchanged
+        chunk texts are served from the embedding cache instead of the encoder.
+        """
+        dropped = []
+        batches = iter_batches(iter_files(paths, suffixes), lambda f: self._changed_chunks(f, dropped), batch_size)
+        stats = ingest(self.vector_store, lambda chunks: self.encoder.encode(chunks), batches,
+                       model_name=self.model_name, encoder_mode=self.encoder_mode,
+                       workers=workers, cache=self.cache, progress=progress)
+        self.vector_store.remove(dropped)
+        self.lexical.sync(self.vector_store)
+        stats.removed = len(dropped)
+        return stats
+
+    def save(self, path: str):
+        self.vector_store.save(path)
+        self.index.sync(self.vector_store)
+        self.index.save(path)
+        self.lexical.sync(self.vector_store)
+        self.lexical.save(path)
+
+    def load(self, path: str, mmap: bool = True):
+        store = VectorStore.load(path, mmap=mmap)
+        if store.model is not None and store.model != self.model_name:
+            raise ValueError(f"store at {path} was built with {store.model}, not {self.model_name}")
+        self.vector_store = store
+        kind, options = self._index_spec
+        self.index = make_index(kind, **options)
+        self.index.load(path)
+        self.lexical = BM25Index()
+        self.lexical.load(path)
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        vectors = [self.query_cache.get(q) for q in queries]
+        missing = list({q: None for q, v in zip(queries, vectors) if v is None})
+        if missing:
+            encoded = dict(zip(missing, np.asarray(self.encoder.encode(missing), dtype=np.float32)))
+            for q, v in encoded.items():
+                self.query_cache.put(q, v)
+            vectors = [encoded[q] if v is None else v for q, v in zip(queries, vectors)]
+        return np.stack(vectors)
+
+    def retrieve_many(self, queries: List[str], k: int, mode: str = 'dense', prefilter: int = 0):
+        """retrieve_context for a batch of questions.
+
+        Uncached questions are encoded in one batch (lexical mode encodes
+        nothing); in dense mode all of them are then scored with one matrix
+        multiply and a per-row partial top k.
+        """
+        if not queries:
+            return []
+        if mode not in ('dense', 'lexical', 'hybrid'):
+            raise ValueError(f"unknown retrieval mode {mode!r}")
+        if mode == 'lexical':
+            return [self.retrieve_context(q, k, mode, prefilter) for q in queries]
+        # One encoder batch; hybrid mode then finds the embeddings in the query cache.
+        embeddings = self._embed_queries(queries)
+        if mode == 'hybrid':
+            return [self.retrieve_context(q, k, mode, prefilter) for q in queries]
+        self.index.sync(self.vector_store)
+        scores, ids = self.index.search(embeddings, k)
+        return [self._results(row_ids, row_scores) for row_ids, row_scores in zip(ids, scores)]
+
+    def retrieve_context(self, q: str, k: int, mode: str = 'dense', prefilter: int = 0):
+        """Top k chunks for `q`.
+
+        `mode` is 'dense' (embeddings), 'lexical' (BM25) or 'hybrid', which fuses
+        both rankings with reciprocal rank fusion. With `prefilter` > 0, hybrid
+        mode only scores embeddings of the top `prefilter` BM25 matches.
+        """
+        if mode not in ('dense', 'lexical', 'hybrid'):
+            raise ValueError(f"unknown retrieval mode {mode!r}")
+        if mode != 'dense':
+            self.lexical.sync(self.vector_store)
+
+        if mode == 'lexical':
+            scores, ids = self.lexical.search(q, k)
+            return self._results(ids, scores)
+
+        question_embedding = self._embed_queries([q])
+        if mode == 'dense':
+            self.index.sync(self.vector_store)
+            scores, ids = self.index.search(question_embedding, k)
+            return self._results(ids[0], scores[0])
+
+        depth = max(4 * k, 20)
+        _, lexical_ids = self.lexical.search(q, max(prefilter, depth))
+        if prefilter and len(lexical_ids):
+            candidates = np.sort(lexical_ids)
+            dense = score_rows(self.vector_store.embeddings, question_embedding, candidates)[0]
+            dense_ids = candidates[np.argsort(-dense, kind='stable')[:depth]]
+        else:
+            self.index.sync(self.vector_store)
+            dense_ids = self.index.search(question_embedding, depth)[1][0]
+        scores, ids = reciprocal_rank_fusion([dense_ids, lexical_ids[:depth]])
+        return self._results(ids[:k], scores[:k])
+
+    def _results(self, ids, scores):
         results = []
-        for idx in top_k_indices:
+        for idx, similarity in zip(ids, scores):
+            if idx < 0:
+                break
             results.append({
-                'source': self.vector_store['sources'][idx],
-                'content': self.vector_store['chunks'][idx],
-                'similarity': similarities[idx]
+                'source': self.vector_store.sources[idx],
+                'content': self.vector_store.chunks[idx],
+                'similarity': float(similarity)
             })
         return results
 
@@ -78,7 +200,8 @@ class SimpleRag():
         ctxs = self.retrieve_context(q, 2)
         prompt = self.make_prompt(q, ctxs)
         sys_prompt = "You are intelligent QA bot, who is very good at providing concise ans. Don't preamble. Just Ans."
-        resp = client.messages.create(
+        resp = cached_create(
+            client,
             model="claude-3-5-haiku-latest",
             max_tokens=2000,
             temperature=0.0,
@@ -87,45 +210,51 @@ class SimpleRag():
         )
         return resp.content[0].text
 
-rag = SimpleRag()
-rag._add_to_store("docs/example.txt")
-
-query = "Who directed movie Mickey 17, and what is it about?"
-rag.query(query)
-
-import base64
-import json
-from utils import visualize_citations
-
-pdf_path = 'docs/2024ltr.pdf' # fill me
-with open(pdf_path, "rb") as f:
-    pdf_data = base64.b64encode(f.read()).decode()
-
-pdf_response = client.messages.create(
-    model="claude-3-5-sonnet-latest",
-    temperature=0.0,
-    max_tokens=4000,
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "document",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "application/pdf",
-                        "data": pdf_data
+def pdf_citations_demo():
+    import base64
+    from utils import visualize_citations
+
+    pdf_path = 'docs/2024ltr.pdf' # fill me
+    with open(pdf_path, "rb") as f:
+        pdf_data = base64.b64encode(f.read()).decode()
+
+    pdf_response = client.messages.create(
+        model="claude-3-5-sonnet-latest",
+        temperature=0.0,
+        max_tokens=4000,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "document",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "application/pdf",
+                            "data": pdf_data
+                        },
+                        "title": "BERKSHIRE HATHAWAY INC. 2024 Letter",
+                        "citations": {"enabled": True}
                     },
-                    "title": "BERKSHIRE HATHAWAY INC. 2024 Letter",
-                    "citations": {"enabled": True}
-                },
-                {
-                    "type": "text",
-                    "text": "How many bizs reported decline in earnings?"
-                }
-            ]
-        }
-    ]
-)
-
-print(visualize_citations(pdf_response))
\ No newline at end of file
+                    {
+                        "type": "text",
+                        "text": "How many bizs reported decline in earnings?"
+                    }
+                ]
+            }
+        ]
+    )
+
+    print(visualize_citations(pdf_response))
+
+def main():
+    rag = SimpleRag()
+    rag._add_to_store("docs/example.txt")
+
+    query = "Who directed movie Mickey 17, and what is it about?"
+    print(rag.query(query))
+
+    pdf_citations_demo()
+
+if __name__ == "__main__":
+    main()
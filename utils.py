@@ -1,37 +1,139 @@
-from typing import List 
+import codecs
+import re
+from collections import deque
+from typing import Callable, Deque, Iterator, List, NamedTuple, Optional, Tuple
 
-<<<<<<< Updated upstream
 ANTHROPIC_API_KEY = "REPLACE ME"
-=======
-ANTHROPIC_API_KEY = "sk-ant-REDACTED"
->>>>>>> Stashed changes
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-    """Split text into overlapping chunks."""
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character offsets into the source: source[start:end] == text
+    end: int
 
-    chunks = []
-    sentences = text.split('. ') 
-    current_chunk = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip() + '. '
-        sentence_length = len(sentence)
-        
-        if current_length + sentence_length > chunk_size and current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append(chunk_text)
-            overlap_text = ' '.join(current_chunk[-2:])
-            current_chunk = [overlap_text]
-            current_length = len(overlap_text)
-        
-        current_chunk.append(sentence)
-        current_length += sentence_length
-    
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    
-    return chunks
+# A sentence ends at . ! or ? (plus closing quotes/brackets) followed by
+# whitespace and something that can start a sentence, or at a blank line.
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+(?=["\'(\[]?[A-Z0-9])|\n[ \t]*\n\s*')
+_ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'vs', 'etc', 'inc', 'ltd', 'co',
+    'corp', 'no', 'fig', 'e.g', 'i.e', 'u.s', 'u.k', 'jan', 'feb', 'mar', 'apr', 'jun',
+    'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+}
+
+
+def _is_abbreviation(text: str, end: int) -> bool:
+    # `end` is the index of the sentence-final punctuation mark.
+    if text[end] != '.':
+        return False
+    start = end
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    word = text[start:end].lstrip('("\'[').lower()
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+def _read_blocks(source, block_size: int) -> Iterator[str]:
+    if isinstance(source, str):
+        for i in range(0, len(source), block_size):
+            yield source[i:i + block_size]
+        return
+    decoder = None
+    while True:
+        block = source.read(block_size)
+        if not block:
+            break
+        if isinstance(block, bytes):
+            decoder = decoder or codecs.getincrementaldecoder('utf-8')(errors='replace')
+            block = decoder.decode(block)
+        yield block
+    if decoder:
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+
+def iter_sentences(source, block_size: int = 1 << 16, max_chars: int = 1 << 16) -> Iterator[Chunk]:
+    """Split text into sentence spans that together cover the source exactly.
+
+    `source` is a string, a text or binary file object, or an mmap. Text is
+    read `block_size` characters at a time; a run of more than `max_chars`
+    without a sentence boundary is cut at whitespace, so memory stays bounded.
+    """
+    buffer, offset = '', 0
+    for block in _read_blocks(source, block_size):
+        buffer += block
+        cut = 0
+        for match in _SENTENCE_END.finditer(buffer):
+            if match.end() == len(buffer):
+                break  # the next block may change where this boundary lands
+            if match.group().startswith(('.', '!', '?')) and _is_abbreviation(buffer, match.start()):
+                continue
+            yield Chunk(buffer[cut:match.end()], offset + cut, offset + match.end())
+            cut = match.end()
+        while len(buffer) - cut > max_chars:
+            split = buffer.rfind(' ', cut, cut + max_chars)
+            split = split + 1 if split > cut else cut + max_chars
+            yield Chunk(buffer[cut:split], offset + cut, offset + split)
+            cut = split
+        buffer, offset = buffer[cut:], offset + cut
+    if buffer:
+        yield Chunk(buffer, offset, offset + len(buffer))
+
+
+def _split_long(sentence: Chunk, max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[Tuple[Chunk, int]]:
+    # A single sentence over the budget is cut between words.
+    pieces = re.finditer(r'\S+\s*', sentence.text)
+    start = end = used = 0
+    for piece in pieces:
+        n = count_tokens(piece.group())
+        if used and used + n > max_tokens:
+            yield Chunk(sentence.text[start:end], sentence.start + start, sentence.start + end), used
+            start, used = end, 0
+        end, used = piece.end(), used + n
+    if end > start:
+        yield Chunk(sentence.text[start:end], sentence.start + start, sentence.start + end), used
+
+
+def _span(units) -> Chunk:
+    text = ''.join(u.text for u in units)
+    stripped = text.strip()
+    lead = len(text) - len(text.lstrip())
+    start = units[0].start + lead
+    return Chunk(stripped, start, start + len(stripped))
+
+
+def iter_chunks(source, max_tokens: int = 200, overlap_tokens: int = 32,
+                count_tokens: Optional[Callable[[str], int]] = None, block_size: int = 1 << 16) -> Iterator[Chunk]:
+    """Stream overlapping chunks of whole sentences, each at most `max_tokens`.
+
+    Consecutive chunks share up to `overlap_tokens` of trailing sentences.
+    `count_tokens` measures text, e.g. with the encoder's tokenizer; the
+    default counts whitespace-separated words. Runs in one pass, in linear
+    time and constant memory, whatever the size of `source`.
+    """
+    count_tokens = count_tokens or (lambda text: len(text.split()))
+    window: Deque[Tuple[Chunk, int]] = deque()
+    used = 0
+    pending = False  # window holds sentences not yet emitted in any chunk
+    for sentence in iter_sentences(source, block_size):
+        n = count_tokens(sentence.text)
+        parts = _split_long(sentence, max_tokens, count_tokens) if n > max_tokens else [(sentence, n)]
+        for unit, n in parts:
+            if window and used + n > max_tokens:
+                if pending:
+                    yield _span([u for u, _ in window])
+                    pending = False
+                while window and (used > overlap_tokens or used + n > max_tokens):
+                    used -= window.popleft()[1]
+            window.append((unit, n))
+            used += n
+            pending = pending or bool(unit.text.strip())
+    if pending:
+        yield _span([u for u, _ in window])
+
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+    """Split text into overlapping chunks of at most `chunk_size` characters."""
+    return [chunk.text for chunk in iter_chunks(text, chunk_size, overlap, count_tokens=len)]
 
 def visualize_citations(response):
     """
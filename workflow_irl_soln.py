@@ -1,36 +1,50 @@
 from typing import List
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import feedparser
 from datetime import datetime
 from time import mktime
-import requests
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
 import anthropic
 import random
+import time
+from llm_cache import cached_create, default_cache, request_key
+from llm_client import shared_client
+from llm_usage import UsageStats
+from feed_fetch import Fetcher, fetch_url
+from http_cache import HttpCache
+from feed_extract import estimate_tokens, extract_main_text
 
 API_KEY = "REPLACE ME"
-client = anthropic.Anthropic(api_key=API_KEY)
+# Paced against the account rate limits, so the parallel stages back off together.
+client = shared_client(API_KEY)
+usage = UsageStats()
+# Feeds and article pages are revalidated with conditional GETs between runs.
+http_cache = HttpCache()
 
-def complete(
+def request_params(
     prompt: str, 
     sys_prompt: str = "",
     prefill: str = "",
     model_name: str = "claude-3-5-haiku-latest",
     temperature: float = 0.0,
     max_tokens: int = 4000,
-    
+    cache_system: bool = False,
 ):
     messages = [{"role": "user", "content": prompt}]
     if prefill != "":
         messages.append({"role": "assistant", "content": prefill})
 
-    message = client.messages.create(
-        model=model_name,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        system=sys_prompt,
-        messages=messages
-    )
+    # A stable system prompt can be marked for server-side prompt caching. It is
+    # only cached once it reaches the model's minimum (2048 tokens for Haiku).
+    system = sys_prompt
+    if cache_system and sys_prompt:
+        system = [{"type": "text", "text": sys_prompt, "cache_control": {"type": "ephemeral"}}]
+
+    return dict(model=model_name, max_tokens=max_tokens, temperature=temperature, system=system, messages=messages)
+
+def complete(prompt: str, sys_prompt: str = "", **options):
+    # Identical requests (same model, prompts and sampling) are served from disk.
+    message = cached_create(client, usage=usage, **request_params(prompt, sys_prompt, **options))
     return message.content[0].text
 
 class RssItem:
@@ -48,7 +62,12 @@ class RssItemDetailed:
         self.highlighted_quote = highlighted_quote
  
 def articles_of(rss_link, start, end):    
-    feed = feedparser.parse(rss_link)
+    result = fetch_url(rss_link, cache=http_cache)
+    if not result.ok:
+        # One bad feed must not take the whole newsletter down with it.
+        print(f"skipping feed {rss_link}: {result.error or result.status}")
+        return
+    feed = feedparser.parse(result.content)
     if isinstance(start, str): start = datetime.fromisoformat(start)
     if isinstance(end, str): end = datetime.fromisoformat(end)
 
@@ -63,38 +82,51 @@ def articles_of(rss_link, start, end):
             yield item
 
 
+# Article text pasted into the quote prompt is cut to this many tokens.
+ARTICLE_TOKENS = 3000
+
+def html_to_text(html):
+    # Only the main article body: no scripts, navigation, sidebars or footers.
+    return extract_main_text(html, max_tokens=ARTICLE_TOKENS)
+
+async def afetch_contents(items, fetcher=None, per_host=5):
+    """Fetch every item's page concurrently, yielding RssItemDetailed as each completes."""
+    if fetcher is None:
+        async with Fetcher(per_host=per_host, cache=http_cache) as fetcher:
+            async for detailed in afetch_contents(items, fetcher):
+                yield detailed
+        return
+
+    async for item, result in fetcher.fetch_many(items, url=lambda item: item.url):
+        if not result.ok:
+            print(f"skipping {item.url}: {result.error or result.status}")
+            continue
+        yield RssItemDetailed(
+            title=item.title,
+            description=item.description,
+            url=item.url,
+            # Off the event loop: pages run up to the fetcher's 5 MiB cap.
+            content=await asyncio.to_thread(html_to_text, result.text),
+            highlighted_quote=""
+        )
+
 def get_contents_from(items, num_workers=5):
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        def fetch_content(item):
-            response = requests.get(item.url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            content = soup.get_text()
-            return RssItemDetailed(
-                title=item.title,
-                description=item.description,
-                url=item.url,
-                content=content,
-                highlighted_quote=""
-            )
-
-        results = executor.map(fetch_content, items)
-        return results
-
-def only_relevant_content(items):
-    contents = ""
-    ids_to_items = {}
-    for item in items:
-        contents += f"<content id=\"{item.id}\" description=\"{item.description}\" url=\"{item.url}\"/>\n"
-        ids_to_items[item.id] = item
+    async def collect():
+        return [item async for item in afetch_contents(items, per_host=num_workers)]
+    return asyncio.run(collect())
 
-    system_prompt = """
+FILTER_SYSTEM_PROMPT = """
     You are a helpful assistant that filters out irrelevant content from my news feed.
     Only keep content that is relevant and seems interesting in area of financial market, 
     software technology, and new breakthrough science. Try to keep some political content as well, but only
     minimal. Keep only political content that is relevant to financial markets.
     """
-    
-    user_prompt = f"""
+
+# Feed items are filtered in shards of about this many prompt tokens, all at once.
+FILTER_SHARD_TOKENS = 6000
+
+def _filter_prompt(contents):
+    return f"""
     Here are list of the contents: Contents are provided in the following format:
     <content id="id" description="description" url="url"/>
 
@@ -111,17 +143,42 @@ def only_relevant_content(items):
     </example>
     """
 
-    filtered_contents = complete(user_prompt, system_prompt)
-    filtered_contents = filtered_contents.split("\n")
+def _shards(lines, max_tokens):
+    shard, used = [], 0
+    for line in lines:
+        tokens = estimate_tokens(line)
+        if shard and used + tokens > max_tokens:
+            yield shard
+            shard, used = [], 0
+        shard.append(line)
+        used += tokens
+    if shard:
+        yield shard
+
+def only_relevant_content(items, shard_tokens=FILTER_SHARD_TOKENS, max_workers=8):
+    lines = []
+    ids_to_items = {}
+    for item in items:
+        lines.append(f"<content id=\"{item.id}\" description=\"{item.description}\" url=\"{item.url}\"/>\n")
+        ids_to_items[item.id] = item
+
+    prompts = [_filter_prompt("".join(shard)) for shard in _shards(lines, shard_tokens)]
+    if not prompts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prompts))) as pool:
+        replies = list(pool.map(lambda prompt: complete(prompt, FILTER_SYSTEM_PROMPT), prompts))
 
+    # Blank lines, stray text and ids the model made up are ignored.
     filtered_items = []
-    for content in filtered_contents:
-        filtered_items.append(ids_to_items[content])
+    for reply in replies:
+        for line in reply.split("\n"):
+            item = ids_to_items.pop(line.strip(), None)
+            if item is not None:
+                filtered_items.append(item)
 
     return filtered_items
 
-def get_valuable_quote(item):
-    system_prompt = """
+QUOTE_SYSTEM_PROMPT = """
     You are a helpful editor at the news aggregator site. Your job is to find the most valuable quote
     from the content provided. The quote should be short and to the point.
 
@@ -132,8 +189,9 @@ def get_valuable_quote(item):
     * Use microhumor
     * Use concrete examples
     """
-    
-    user_prompt = f"""
+
+def _quote_prompt(item):
+    return f"""
     Here is the content:
     {item.content}
 
@@ -146,7 +204,60 @@ def get_valuable_quote(item):
     expected to agree on the production levels.
     </example>
     """
-    return complete(user_prompt, system_prompt)
+
+def get_valuable_quote(item):
+    return complete(_quote_prompt(item), QUOTE_SYSTEM_PROMPT)
+
+def quote_in_batch(items, poll_interval=30.0, timeout=24 * 3600, fallback=True):
+    """Fill in `highlighted_quote` for `items` with one Message Batch instead of one call each.
+
+    Requests already in the response cache are answered from it and not sent.
+    The batch is polled every `poll_interval` seconds and canceled after
+    `timeout`. Requests that error, expire or are canceled are retried one by
+    one if `fallback` is set. Returns the items still left without a quote.
+    """
+    cache = default_cache()
+    pending = {}
+    for i, item in enumerate(items):
+        params = request_params(_quote_prompt(item), QUOTE_SYSTEM_PROMPT)
+        key = request_key(params)
+        cached = cache.get(key)
+        if cached is not None:
+            item.highlighted_quote = cached.content[0].text
+        else:
+            pending[f"quote-{i}"] = (item, params, key)
+    if not pending:
+        return []
+
+    batch = client.messages.batches.create(
+        requests=[{"custom_id": custom_id, "params": params} for custom_id, (_, params, _) in pending.items()]
+    )
+    deadline = time.monotonic() + timeout
+    while batch.processing_status != "ended":
+        if time.monotonic() > deadline and batch.cancel_initiated_at is None:
+            # Canceling still ends the batch, with whatever finished so far.
+            batch = client.messages.batches.cancel(batch.id)
+        time.sleep(poll_interval)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    for entry in client.messages.batches.results(batch.id):
+        if entry.custom_id not in pending or entry.result.type != "succeeded":
+            continue
+        item, params, key = pending.pop(entry.custom_id)
+        message = entry.result.message
+        usage.record(message)
+        cache.put(key, message)
+        item.highlighted_quote = message.content[0].text
+
+    failed = [item for item, _, _ in pending.values()]
+    print(f"batch {batch.id}: {batch.request_counts.succeeded} succeeded, {len(failed)} failed")
+    if fallback:
+        for item in failed:
+            try:
+                item.highlighted_quote = get_valuable_quote(item)
+            except anthropic.APIError as e:
+                print(f"no quote for {item.url}: {e}")
+    return [item for item in failed if not item.highlighted_quote]
 
 def present_content(items):
     print("items", items)
@@ -208,28 +319,130 @@ Africa
     </contents>
     """
 
+    # The system prompt (about 460 tokens) is under Haiku's 2048-token minimum for
+    # prompt caching, so it is not marked: the API would ignore the breakpoint.
     newsletter = complete(user_prompt, system_prompt)
     print("newsletter", newsletter)
     return newsletter
 
+# Streaming pipeline: parse -> filter -> fetch -> quote -> assemble. Stages are
+# connected by bounded queues and each runs its own number of workers, so page
+# fetches overlap filter calls and quotes are generated in parallel.
+_DONE = object()
+
+async def _stage(name, inbox, outbox, work, workers, timings):
+    """Run `workers` copies of `work` over `inbox`; every value each call returns goes to `outbox`."""
+    busy = 0.0
+
+    async def worker():
+        nonlocal busy
+        while True:
+            value = await inbox.get()
+            if value is _DONE:
+                await inbox.put(_DONE)  # let sibling workers see it too
+                return
+            started = time.perf_counter()
+            results = await work(value)
+            busy += time.perf_counter() - started
+            for result in results:
+                await outbox.put(result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    await outbox.put(_DONE)
+    timings[name] = (time.perf_counter() - started, busy)
+
+async def newsletter(feeds, start, end, quote_fraction=0.1, filter_batch=50, filter_workers=2,
+                     fetch_workers=16, quote_workers=4, queue_size=64, batch=False):
+    """Build the newsletter for `feeds`, streaming items through every stage as soon as they are ready.
+
+    With `batch`, sampled articles are quoted together in one Message Batch
+    once everything is fetched, rather than as they stream past.
+    """
+    feed_q = asyncio.Queue()
+    batch_q, relevant_q, page_q, quoted_q = (asyncio.Queue(queue_size) for _ in range(4))
+    timings = {}
+    sampled = []
+
+    async def parse(feed):
+        items = await asyncio.to_thread(lambda: list(articles_of(feed, start, end)))
+        return [items[i:i + filter_batch] for i in range(0, len(items), filter_batch)]
+
+    async def relevant(batch):
+        return await asyncio.to_thread(only_relevant_content, batch)
+
+    async def fetch(item):
+        result = await fetcher.fetch(item.url)
+        if not result.ok:
+            print(f"skipping {item.url}: {result.error or result.status}")
+            return []
+        # Extraction is CPU work on bodies of up to 5 MiB: keep it off the event loop.
+        text = await asyncio.to_thread(html_to_text, result.text)
+        return [RssItemDetailed(item.title, item.description, item.url, text, "")]
+
+    async def quote(item):
+        if random.random() < quote_fraction:
+            sampled.append(item)
+            if not batch:
+                item.highlighted_quote = await asyncio.to_thread(get_valuable_quote, item)
+        return [item]
+
+    for feed in feeds:
+        feed_q.put_nowait(feed)
+    feed_q.put_nowait(_DONE)
+
+    async with Fetcher(per_host=fetch_workers, cache=http_cache) as fetcher:
+        stages = [
+            asyncio.ensure_future(_stage("parse", feed_q, batch_q, parse, len(feeds), timings)),
+            asyncio.ensure_future(_stage("filter", batch_q, relevant_q, relevant, filter_workers, timings)),
+            asyncio.ensure_future(_stage("fetch", relevant_q, page_q, fetch, fetch_workers, timings)),
+            asyncio.ensure_future(_stage("quote", page_q, quoted_q, quote, quote_workers, timings)),
+        ]
+
+        async def assemble():
+            contents = []
+            while (item := await quoted_q.get()) is not _DONE:
+                contents.append(item)
+            return contents
+
+        # A failing stage fails the whole run instead of leaving the rest waiting on its queue.
+        try:
+            contents = (await asyncio.gather(*stages, assemble()))[-1]
+        finally:
+            for stage in stages:
+                stage.cancel()
+
+    # Sampling is per item as they stream past; still quote at least one.
+    if contents and not sampled:
+        sampled.append(contents[0])
+        if not batch:
+            contents[0].highlighted_quote = await asyncio.to_thread(get_valuable_quote, contents[0])
+    if batch and sampled:
+        started = time.perf_counter()
+        await asyncio.to_thread(quote_in_batch, sampled)
+        elapsed = time.perf_counter() - started
+        timings["batch"] = (elapsed, elapsed)
+
+    started = time.perf_counter()
+    letter = await asyncio.to_thread(present_content, contents)
+    elapsed = time.perf_counter() - started
+    timings["assemble"] = (elapsed, elapsed)
+    for name, (wall, busy) in timings.items():
+        print(f"{name:>8}: done after {wall:.2f}s, {busy:.2f}s of work")
+    return letter
+
 example_rss_feeds = [
     "https://www.micahlerner.com/feed.xml",
     "https://distributed-computing-musings.com/rss"
 ]
 
-def main():
-    items = articles_of("https://www.theguardian.com/rss", "2025-03-20", "2025-03-21")
-    filtered_items = only_relevant_content(items)
-    contents = list(get_contents_from(filtered_items))
-
-    # Randomly select 10% of the filtered items, and get quote
-    num_samples = max(1, int(len(contents) * 0.1))
-    random_indexes = random.sample(range(len(contents)), num_samples)
-    for idx in random_indexes:
-        contents[idx].highlighted_quote = get_valuable_quote(contents[idx])
-
-    # Present the content
-    present_content(contents)
+def main(batch=False):
+    asyncio.run(newsletter(["https://www.theguardian.com/rss"], "2025-03-20", "2025-03-21", batch=batch))
+    print("usage", usage.summary())
+    print("http cache", http_cache.stats())
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", action="store_true", help="quote articles with one Message Batch")
+    main(**vars(parser.parse_args()))